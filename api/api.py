@@ -21,7 +21,7 @@ class User(UserMixin):
 def user_loader(userid):  
     user = User()
     user.id = userid
-    data = Member.get_role(userid)
+    data = Member.get_identity(userid)
     try:
         user.role = data[0]
         user.name = data[1]
@@ -50,6 +50,8 @@ def login():
             user = User()
             user.id = user_id
             login_user(user)
+            # 登入時已查出身分與姓名，直接放進快取，之後的請求不必再查
+            Member.cache_identity(user_id, identity, data[0][4])
 
             if( identity == 'user'):
                 return redirect(url_for('bookstore.playerlist'))
@@ -67,24 +69,19 @@ def login():
 def register():
     if request.method == 'POST':
         user_account = request.form['account']
-        exist_account = Member.get_all_account()
-        account_list = []
-        for i in exist_account:
-            account_list.append(i[0])
-
-        if(user_account in account_list):
+        input = { 
+            'lname': request.form['userlname'],
+            'fname': request.form['userfname'],
+            'account':user_account, 
+            'password':request.form['password'], 
+            'identity':request.form['identity'] 
+        }
+
+        # 帳號重複時 INSERT ... ON CONFLICT 不會新增，回傳 None
+        if Member.create_member(input) is None:
             flash('Falied!')
             return redirect(url_for('api.register'))
-        else:
-            input = { 
-                'lname': request.form['userlname'],
-                'fname': request.form['userfname'],
-                'account':user_account, 
-                'password':request.form['password'], 
-                'identity':request.form['identity'] 
-            }
-            Member.create_member(input)
-            return redirect(url_for('api.login'))
+        return redirect(url_for('api.login'))
 
     return render_template('register.html')
 
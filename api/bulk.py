@@ -0,0 +1,214 @@
+import csv
+import io
+
+import click
+import psycopg2
+
+from api.metrics import QueryTimer
+from api.scores import scores_json
+from api.sql import DB, Game, TableVersion, TeamStanding
+
+
+class BulkImportError(ValueError):
+    pass
+
+
+# 每張表可匯入的欄位、必填欄位、檔案內不可重複的主鍵與參照檢查
+IMPORT_TABLES = {
+    'game': {
+        'columns': ['winteam', 'loseteam', 'date', 'fname', 'result'],
+        'required': ['winteam', 'loseteam', 'date'],
+        'key': ['winteam', 'loseteam', 'date'],
+        'references': [('winteam', 'team', 'tname'), ('loseteam', 'team', 'tname'), ('fname', 'field', 'fname')],
+    },
+    'player': {
+        'columns': ['tname', 'pno', 'name', 'birthday', 'position', 'height', 'weight', 'education'],
+        'required': ['tname', 'pno'],
+        'key': ['tname', 'pno'],
+        'references': [('tname', 'team', 'tname')],
+    },
+    'coach': {
+        'columns': ['cno', 'cname', 'birthday', 'tname'],
+        'required': ['cno'],
+        'key': ['cno'],
+        'references': [('tname', 'team', 'tname')],
+    },
+    'field': {
+        'columns': ['fid', 'fname', 'address'],
+        'required': ['fid'],
+        'key': ['fid'],
+        'references': [],
+    },
+}
+
+
+def _read_header(fileobj):
+    # 讀第一行取得欄位順序，剩下的內容原封不動交給 COPY
+    header_line = fileobj.readline()
+    if isinstance(header_line, bytes):
+        header_line = header_line.decode('utf-8-sig')
+    header = next(csv.reader([header_line]), [])
+    return [h.strip().lower() for h in header if h.strip()]
+
+
+def _validate(cursor, table, spec, columns):
+    errors = []
+
+    for col in spec['required']:
+        if col not in columns:
+            errors.append(f"缺少必要欄位 {col}")
+    if errors:
+        return errors
+
+    for col in spec['required']:
+        cursor.execute(f"SELECT COUNT(*) FROM stage WHERE {col} IS NULL")
+        n = cursor.fetchone()[0]
+        if n:
+            errors.append(f"{n} 筆資料的 {col} 為空")
+
+    key = ', '.join(spec['key'])
+    cursor.execute(f"SELECT {key}, COUNT(*) FROM stage GROUP BY {key} HAVING COUNT(*) > 1 LIMIT 5")
+    for row in cursor.fetchall():
+        errors.append(f"檔案內重複的資料: {row[:-1]} 出現 {row[-1]} 次")
+
+    for col, ref_table, ref_col in spec['references']:
+        if col not in columns:
+            continue
+        cursor.execute(f'''
+            SELECT DISTINCT s.{col}
+            FROM stage s
+            WHERE s.{col} IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM {ref_table} r WHERE r.{ref_col} = s.{col})
+            LIMIT 5
+        ''')
+        missing = [r[0] for r in cursor.fetchall()]
+        if missing:
+            errors.append(f"{col} 參照不存在的 {ref_table}: {', '.join(map(str, missing))}")
+
+    return errors
+
+
+def _merge_sql(table, spec, columns):
+    # 以 spec['key'] 判斷資料是否已存在 (不依賴表上是否有 unique constraint)；
+    # 呼叫前已鎖表，判斷與新增之間不會有其他寫入插進來
+    cols = ', '.join(columns)
+    match = ' AND '.join(f"t.{k} = s.{k}" for k in spec['key'])
+    insert = f'''
+        INSERT INTO {table} ({cols})
+        SELECT {', '.join('s.' + c for c in columns)} FROM stage s
+        WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE {match})
+        ON CONFLICT DO NOTHING
+    '''
+    if table != 'game':
+        return insert
+    # 賽局匯入時一併以增量更新戰績表，最後回傳實際新增的賽局數
+    return f'''
+        WITH g AS (
+            {insert}
+            RETURNING winteam, loseteam
+        ),
+        delta AS (
+    ''' + TeamStanding.delta_rows('g', 1) + '''
+        ),
+        standing AS (
+    ''' + TeamStanding.APPLY_DELTA + '''
+        )
+        SELECT COUNT(*) FROM g
+    '''
+
+
+def _store_scores(cursor):
+    # 匯入的賽局與 Game.add_game 一樣在寫入時解析比分
+    cursor.execute("SELECT winteam, loseteam, date, result FROM stage WHERE result IS NOT NULL")
+    scores = scores_json(cursor.fetchall())
+    if scores:
+        cursor.execute(Game.STORE_SCORES, (scores,))
+
+
+def import_csv(table, fileobj):
+    """
+    以 COPY FROM STDIN 將 CSV 串流進暫存表，驗證後在同一個交易內合併進正式表。
+    CSV 第一行為欄位名稱；回傳 {'staged': 筆數, 'inserted': 新增筆數, 'skipped': 已存在而略過的筆數}。
+    驗證失敗時整批取消並丟出 BulkImportError
+    """
+    spec = IMPORT_TABLES.get(table)
+    if spec is None:
+        raise BulkImportError(f"不支援匯入的資料表: {table}")
+
+    columns = _read_header(fileobj)
+    unknown = [c for c in columns if c not in spec['columns']]
+    if not columns or unknown:
+        raise BulkImportError(f"無法辨識的欄位: {', '.join(unknown) or '(空白標題列)'}")
+
+    timer = QueryTimer(f"COPY {table} FROM STDIN")
+    connection = DB.connect()
+    timer.connected()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'''
+                CREATE TEMP TABLE stage ON COMMIT DROP AS
+                SELECT {', '.join(columns)} FROM {table} WITH NO DATA
+            ''')
+            cursor.copy_expert(
+                f"COPY stage ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                fileobj
+            )
+            cursor.execute("SELECT COUNT(*) FROM stage")
+            staged = cursor.fetchone()[0]
+
+            errors = _validate(cursor, table, spec, columns)
+            if errors:
+                raise BulkImportError('；'.join(errors))
+
+            cursor.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE")
+            cursor.execute(_merge_sql(table, spec, columns))
+            if table == 'game':
+                inserted = cursor.fetchone()[0]
+                if 'result' in columns:
+                    _store_scores(cursor)
+            else:
+                inserted = cursor.rowcount
+            # 版本號與匯入的資料一起 commit
+            cursor.execute(TableVersion.BUMP, (table,))
+            version = cursor.fetchone()[0]
+            connection.commit()
+            timer.rows = inserted
+    except BulkImportError as e:
+        print(f"Error importing {table}: {e}")
+        timer.error = True
+        connection.rollback()
+        raise e
+    except psycopg2.Error as e:
+        # 日期格式錯誤、數字欄位不是數字、欄位數不符等，由 COPY / 合併時的資料庫錯誤回報
+        print(f"Error importing {table}: {e}")
+        timer.error = True
+        connection.rollback()
+        raise BulkImportError(f"資料格式錯誤: {(e.pgerror or str(e)).strip()}") from e
+    finally:
+        DB.release(connection)
+        timer.finish()
+
+    TableVersion.remember(table, version)
+    return {'staged': staged, 'inserted': inserted, 'skipped': staged - inserted}
+
+
+@click.command('import-csv')
+@click.argument('table', type=click.Choice(sorted(IMPORT_TABLES)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def import_csv_command(table, path):
+    """匯入 CSV 到 game / player / coach / field，例如: flask import-csv game season.csv"""
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        try:
+            result = import_csv(table, f)
+        except BulkImportError as e:
+            raise click.ClickException(str(e))
+    click.echo(f"{table}: 讀入 {result['staged']} 筆，新增 {result['inserted']} 筆，略過 {result['skipped']} 筆")
+
+
+def import_upload(table, storage):
+    # 後台上傳的 FileStorage 以文字串流交給 COPY，不整份讀進記憶體
+    stream = io.TextIOWrapper(storage.stream, encoding='utf-8-sig', newline='')
+    try:
+        return import_csv(table, stream)
+    finally:
+        stream.detach()
@@ -0,0 +1,41 @@
+import hashlib
+from functools import wraps
+
+from flask import make_response, request, session
+from flask_login import current_user
+
+from api.sql import TableVersion
+
+
+def page_etag(tables):
+    # 同一使用者、同樣的網址參數、資料表版本相同 => 頁面內容相同
+    versions = TableVersion.get(*tables)
+    key = f"{request.endpoint}|{request.query_string.decode()}|{current_user.get_id()}|{versions}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def conditional_get(*tables):
+    """
+    前台唯讀頁面的 Conditional GET：ETag 由相關資料表的版本號計算，
+    If-None-Match 相符時直接回 304，不執行 view (不查資料庫、不 render)
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # 有待顯示的 flash 訊息時照常 render，否則訊息會被 304 吃掉
+            if request.method != 'GET' or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            etag = page_etag(tables)
+            if etag in request.if_none_match:
+                response = make_response('', 304)
+                response.set_etag(etag)
+                return response
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,88 @@
+import csv
+import io
+import json
+
+import click
+
+from api.sql import DB
+
+# 可匯出的資料：(欄位名稱, SQL)；皆以 server-side cursor 串流，不受資料量影響記憶體
+EXPORTS = {
+    'games': (
+        ['winteam', 'loseteam', 'date', 'fname', 'result'],
+        'SELECT winteam, loseteam, date, fname, result FROM game ORDER BY date, winteam, loseteam'
+    ),
+    'orders': (
+        ['oid', 'mid', 'ordertime', 'price', 'tno', 'pid', 'pname', 'amount', 'saleprice', 'total'],
+        '''
+        SELECT o.oid, o.mid, o.ordertime, o.price, o.tno, r.pid, p.pname, r.amount, r.saleprice, r.total
+        FROM order_list o
+        JOIN record r ON o.tno = r.tno
+        LEFT JOIN product p ON r.pid = p.pid
+        ORDER BY o.oid, r.pid
+        '''
+    ),
+    'players': (
+        ['tname', 'pno', 'name', 'birthday', 'position', 'height', 'weight', 'education'],
+        'SELECT tname, pno, name, birthday, position, height, weight, education FROM player ORDER BY tname, pno'
+    ),
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+CHUNK_ROWS = 500
+
+
+def export_rows(name):
+    header, sql = EXPORTS[name]
+    return header, DB.stream(sql)
+
+
+def to_csv(header, rows):
+    # 每 CHUNK_ROWS 列輸出一個區塊，避免一列一個 chunk 的額外負擔
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(header)
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % CHUNK_ROWS == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def to_ndjson(header, rows):
+    chunk = []
+    for row in rows:
+        chunk.append(json.dumps(dict(zip(header, row)), ensure_ascii=False, default=str))
+        if len(chunk) >= CHUNK_ROWS:
+            yield '\n'.join(chunk) + '\n'
+            chunk = []
+    if chunk:
+        yield '\n'.join(chunk) + '\n'
+
+
+def generate(name, fmt):
+    header, rows = export_rows(name)
+    if fmt == 'csv':
+        return to_csv(header, rows)
+    return to_ndjson(header, rows)
+
+
+@click.command('export')
+@click.argument('name', type=click.Choice(sorted(EXPORTS)))
+@click.option('--format', 'fmt', type=click.Choice(sorted(FORMATS)), default='csv')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='輸出檔案 (預設為標準輸出)')
+def export_command(name, fmt, output):
+    """串流匯出 games / orders / players，例如: flask export games --format ndjson -o games.ndjson"""
+    if output:
+        with open(output, 'w', encoding='utf-8', newline='') as f:
+            for chunk in generate(name, fmt):
+                f.write(chunk)
+    else:
+        for chunk in generate(name, fmt):
+            click.echo(chunk, nl=False)
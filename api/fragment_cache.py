@@ -0,0 +1,44 @@
+import os
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+from api.cache import TTLCache
+
+FRAGMENT_CACHE_SIZE = int(os.getenv('FRAGMENT_CACHE_SIZE', 256))
+
+
+class FragmentCacheExtension(Extension):
+    """
+    Jinja 的 {% cache key, ... %}...{% endcache %} 區塊：
+    以所有參數組成快取鍵，保存 render 好的 HTML (LRU 淘汰)。
+    參數應包含篩選條件與 view 在查詢資料「之前」讀到的 TableVersion.get(...)，
+    render 時才讀版本號的話，查詢後才發生的寫入會讓舊資料存到新版本的鍵下
+    """
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=TTLCache(maxsize=FRAGMENT_CACHE_SIZE))
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_cache_support', [nodes.List(args)]), [], [], body
+        ).set_lineno(lineno)
+
+    def _cache_support(self, key_parts, caller):
+        key = repr(tuple(key_parts))
+        rv = self.environment.fragment_cache.get(key)
+        if rv is None:
+            rv = caller()
+            self.environment.fragment_cache.set(key, rv)
+        return rv
+
+
+def init_app(app):
+    app.jinja_env.add_extension(FragmentCacheExtension)
@@ -0,0 +1,121 @@
+import logging
+import os
+import re
+import threading
+import time
+
+from flask import g, has_request_context, request
+
+slow_log = logging.getLogger('api.sql.slow')
+
+SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', 200))
+
+
+def normalize_sql(sql):
+    # 合併空白並去掉行尾的反斜線，讓同一條 SQL 在統計中只算一筆
+    return re.sub(r'[\s\\]+', ' ', str(sql)).strip()
+
+
+class QueryStats:
+    """
+    每條 SQL 的呼叫次數、總耗時、最大耗時、回傳列數與等待連線時間，
+    以及每個 Flask endpoint 的請求數、查詢數與 DB 總耗時
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.statements = {}
+        self.endpoints = {}
+
+    def record(self, sql, elapsed, rows, pool_wait, error=False):
+        key = normalize_sql(sql)
+        with self._lock:
+            s = self.statements.get(key)
+            if s is None:
+                s = self.statements[key] = {
+                    'sql': key, 'calls': 0, 'errors': 0, 'total_time': 0.0,
+                    'max_time': 0.0, 'rows': 0, 'pool_wait': 0.0,
+                }
+            s['calls'] += 1
+            s['errors'] += 1 if error else 0
+            s['total_time'] += elapsed
+            s['max_time'] = max(s['max_time'], elapsed)
+            s['rows'] += rows or 0
+            s['pool_wait'] += pool_wait
+
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            slow_log.warning("slow query %.1f ms (pool wait %.1f ms, %s rows): %s",
+                             elapsed * 1000, pool_wait * 1000, rows, key)
+
+        if has_request_context():
+            g.db_queries = g.get('db_queries', 0) + 1
+            g.db_time = g.get('db_time', 0.0) + elapsed
+
+    def record_request(self, endpoint, queries, db_time):
+        with self._lock:
+            e = self.endpoints.get(endpoint)
+            if e is None:
+                e = self.endpoints[endpoint] = {
+                    'endpoint': endpoint, 'requests': 0, 'queries': 0, 'db_time': 0.0,
+                }
+            e['requests'] += 1
+            e['queries'] += queries
+            e['db_time'] += db_time
+
+    def top_statements(self, n=20):
+        with self._lock:
+            rows = [dict(s) for s in self.statements.values()]
+        rows.sort(key=lambda s: s['total_time'], reverse=True)
+        return rows[:n]
+
+    def endpoint_summary(self):
+        with self._lock:
+            rows = [dict(e) for e in self.endpoints.values()]
+        rows.sort(key=lambda e: e['db_time'], reverse=True)
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self.statements.clear()
+            self.endpoints.clear()
+
+
+query_stats = QueryStats()
+
+
+class QueryTimer:
+    """
+    DB.fetchall / fetchone / execute / execute_input 使用：
+    建立時開始計時，connected() 標記拿到連線 (之前為等待連線池時間)，finish() 寫入統計
+    """
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.rows = None
+        self.error = False
+        self._start = time.perf_counter()
+        self._connected = self._start
+
+    def connected(self):
+        self._connected = time.perf_counter()
+
+    def finish(self):
+        now = time.perf_counter()
+        query_stats.record(self.sql, now - self._connected, self.rows,
+                           self._connected - self._start, self.error)
+
+
+# 沒有對應路由的請求 (404、掃描流量) 都記在這個鍵，不以原始路徑為鍵，統計表才不會無限成長
+UNMATCHED_ENDPOINT = '<unmatched>'
+
+
+def init_app(app):
+    # 每個請求結束時把查詢數與 DB 時間記到該 endpoint，並附在回應標頭方便除錯
+    @app.after_request
+    def _record_db_usage(response):
+        queries = g.get('db_queries', 0)
+        db_time = g.get('db_time', 0.0)
+        query_stats.record_request(request.endpoint or UNMATCHED_ENDPOINT, queries, db_time)
+        response.headers['X-DB-Queries'] = str(queries)
+        response.headers['X-DB-Time-Ms'] = f"{db_time * 1000:.1f}"
+        return response
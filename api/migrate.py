@@ -0,0 +1,95 @@
+import glob
+import os
+
+import click
+import psycopg2
+
+from api.metrics import QueryTimer
+from api.sql import DB, Game, SalesRollup, TableVersion, TeamStanding
+
+# 依檔名順序執行的結構升級檔，每個檔案都可重複執行
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), '..', 'migrations')
+
+
+def split_statements(text):
+    # 以行尾的分號切開 SQL 檔並略過註解行；$$ ... $$ 之間 (函式本體) 的分號不切
+    statements, current, in_body = [], [], False
+    for line in text.splitlines():
+        if not in_body and line.strip().startswith('--'):
+            continue
+        current.append(line)
+        if line.count('$$') % 2:
+            in_body = not in_body
+        if not in_body and line.rstrip().endswith(';'):
+            statement = '\n'.join(current).strip().rstrip(';').strip()
+            if statement:
+                statements.append(statement)
+            current = []
+    tail = '\n'.join(current).strip()
+    if tail:
+        statements.append(tail)
+    return statements
+
+
+def run_file(path):
+    """
+    以 autocommit 逐句執行一個 SQL 檔 (CREATE INDEX CONCURRENTLY 不能在交易區塊內)，回傳執行的句數。
+    某一句失敗時停止並丟出錯誤，已執行的句子不會復原，修正後重新執行即可
+    """
+    with open(path, encoding='utf-8') as f:
+        statements = split_statements(f.read())
+
+    connection = DB.connect()
+    connection.autocommit = True
+    try:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                timer = QueryTimer(sql)
+                try:
+                    cursor.execute(sql)
+                except psycopg2.Error as e:
+                    print(f"Error executing SQL: {e}")
+                    timer.error = True
+                    raise e
+                finally:
+                    timer.finish()
+    finally:
+        connection.autocommit = False
+        DB.release(connection)
+    return len(statements)
+
+
+def backfill():
+    """
+    補上結構升級後才開始維護的資料：空的 team_standing / sales_rollup 由 game / order_list 重建，
+    尚未解析的賽局比分重新解析。回傳 {項目: 筆數或是否重建}
+    """
+    result = {}
+    row = DB.fetchone('''
+        SELECT NOT EXISTS (SELECT 1 FROM team_standing) AND EXISTS (SELECT 1 FROM game),
+               NOT EXISTS (SELECT 1 FROM sales_rollup) AND EXISTS (SELECT 1 FROM order_list)
+    ''')
+    result['team_standing'] = bool(row[0])
+    if row[0]:
+        TeamStanding.rebuild()
+    result['sales_rollup'] = bool(row[1])
+    if row[1]:
+        SalesRollup.rebuild()
+    result['scores'] = Game.backfill_scores()
+    if result['team_standing'] or result['scores']:
+        TableVersion.bump('game')
+    return result
+
+
+@click.command('migrate')
+def migrate_command():
+    """執行 migrations/ 下的結構升級並補上衍生資料；部署新版本後 (新資料庫載入 ebook.sql 後) 執行一次"""
+    for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, '*.sql'))):
+        n = run_file(path)
+        click.echo(f"{os.path.basename(path)}: 執行 {n} 句")
+    result = backfill()
+    if result['team_standing']:
+        click.echo("team_standing: 已由 game 重建")
+    if result['sales_rollup']:
+        click.echo("sales_rollup: 已由 order_list 重建")
+    click.echo(f"game: 解析 {result['scores']} 筆比分")
@@ -0,0 +1,227 @@
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+
+class PoolTimeout(PoolError):
+    pass
+
+
+class ConnectionPool:
+    """
+    執行緒安全的連線池 (取代 psycopg2 的 SimpleConnectionPool)：
+    - 連線用完時在 timeout 內排隊等待，而不是立刻丟出例外
+    - 取出連線時丟棄已斷線 / 狀態不明的連線並補開新連線；
+      閒置超過 check_idle 秒的連線先以 SELECT 1 確認伺服器端還在 (例如被防火牆或 idle timeout 切斷)
+    - stats() 提供使用中、閒置數量、等待時間分布與失敗次數
+    """
+
+    # 等待時間分布的區間上限 (秒)，最後一格為 +Inf
+    WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+    def __init__(self, minconn, maxconn, timeout=10.0, check_idle=30.0, **kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self._kwargs = kwargs
+
+        self._idle = deque()
+        self._idle_since = {}
+        self._in_use = set()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self._waiting = 0
+        self._wait_counts = [0] * (len(self.WAIT_BUCKETS) + 1)
+        self._wait_total = 0.0
+        self._checkouts = 0
+        self._failures = 0
+        self._timeouts = 0
+        self._discarded = 0
+
+        for _ in range(minconn):
+            self._push_idle(self._connect())
+
+    def _connect(self):
+        return psycopg2.connect(**self._kwargs)
+
+    @staticmethod
+    def _is_broken(conn):
+        if conn.closed:
+            return True
+        return conn.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN
+
+    @staticmethod
+    def _ping(conn):
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _push_idle(self, conn):
+        self._idle.append(conn)
+        self._idle_since[conn] = time.monotonic()
+
+    def _pop_idle(self):
+        # 回傳 (連線, 閒置秒數)
+        conn = self._idle.pop()
+        return conn, time.monotonic() - self._idle_since.pop(conn, 0.0)
+
+    def _discard(self, conn):
+        self._discarded += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _record_wait(self, waited):
+        self._wait_total += waited
+        for i, bound in enumerate(self.WAIT_BUCKETS):
+            if waited <= bound:
+                self._wait_counts[i] += 1
+                return
+        self._wait_counts[-1] += 1
+
+    def getconn(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+
+        while True:
+            conn, idle_for = self._acquire(timeout, deadline)
+            # 在鎖外確認閒置太久的連線，失敗就丟棄並重新取一條
+            if idle_for is None or idle_for < self.check_idle or self._ping(conn):
+                with self._cond:
+                    return self._checked_out(conn, start)
+            with self._cond:
+                self._in_use.discard(conn)
+                self._discard(conn)
+                self._cond.notify()
+
+    def _acquire(self, timeout, deadline):
+        # 回傳 (連線, 閒置秒數)；新開的連線閒置秒數為 None
+        with self._cond:
+            if self._closed:
+                raise PoolError("connection pool is closed")
+
+            self._waiting += 1
+            try:
+                while True:
+                    while self._idle:
+                        conn, idle_for = self._pop_idle()
+                        if self._is_broken(conn):
+                            self._discard(conn)
+                            continue
+                        self._in_use.add(conn)
+                        return conn, idle_for
+
+                    if len(self._in_use) < self.maxconn:
+                        # 先佔位再於鎖外開連線，避免建立連線時卡住其他執行緒
+                        placeholder = object()
+                        self._in_use.add(placeholder)
+                        break
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        self._failures += 1
+                        raise PoolTimeout(
+                            f"no connection available within {timeout:.1f}s "
+                            f"(in use {len(self._in_use)}/{self.maxconn})"
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+        try:
+            conn = self._connect()
+        except psycopg2.Error:
+            with self._cond:
+                self._in_use.discard(placeholder)
+                self._failures += 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._in_use.discard(placeholder)
+            self._in_use.add(conn)
+            return conn, None
+
+    def _checked_out(self, conn, start):
+        self._checkouts += 1
+        self._record_wait(time.monotonic() - start)
+        return conn
+
+    def warm_up(self, n):
+        # 預先開好 n 條閒置連線（不超過 maxconn），讓第一批請求不用等建立連線
+        opened = 0
+        while opened < n:
+            with self._cond:
+                if self._closed or len(self._idle) + len(self._in_use) >= min(n, self.maxconn):
+                    return opened
+            conn = self._connect()
+            with self._cond:
+                self._push_idle(conn)
+                self._cond.notify()
+            opened += 1
+        return opened
+
+    def putconn(self, conn, close=False):
+        with self._cond:
+            if conn not in self._in_use:
+                raise PoolError("trying to put unkeyed connection")
+            self._in_use.discard(conn)
+
+            if not close and not self._closed and not conn.closed:
+                status = conn.info.transaction_status
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    close = True
+                elif status != extensions.TRANSACTION_STATUS_IDLE:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        close = True
+
+            if close or self._closed or conn.closed:
+                self._discard(conn)
+            else:
+                self._push_idle(conn)
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._discard(self._pop_idle()[0])
+            for conn in list(self._in_use):
+                if hasattr(conn, 'close'):
+                    self._discard(conn)
+            self._in_use.clear()
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            histogram = {}
+            for bound, count in zip(self.WAIT_BUCKETS, self._wait_counts):
+                histogram[f"<={bound}s"] = count
+            histogram["+Inf"] = self._wait_counts[-1]
+            return {
+                'max': self.maxconn,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'checkouts': self._checkouts,
+                'checkout_failures': self._failures,
+                'timeouts': self._timeouts,
+                'discarded': self._discarded,
+                'wait_seconds_total': round(self._wait_total, 6),
+                'wait_histogram': histogram,
+            }
@@ -0,0 +1,65 @@
+import json
+import re
+
+# 逐局得分每隊至少要有的局數；少於此數的 "a / b" (例如日期、分數) 不視為逐局比分
+MIN_INNINGS = 5
+
+# 比賽結果中的比數，例如 "5:3"、"5-3"、"兄弟 5 比 3 樂天"
+SCORE_RE = re.compile(r'(?<![\d-])(\d{1,2})\s*(?::|-|－|比|to)\s*(\d{1,2})(?![\d-])', re.IGNORECASE)
+
+# 選填的逐局得分，兩隊各一列以 / 分隔，例如 "0 1 0 2 0 0 0 2 0 / 0 0 0 1 0 0 2 0 x"，沒打的半局填 x
+_INNING = r'(?:\d{1,2}|[xX])'
+_LINE = rf'{_INNING}(?:[\s,]+{_INNING}){{{MIN_INNINGS - 1},}}'
+LINE_RE = re.compile(rf'(?<![\d/])({_LINE})\s*/\s*({_LINE})(?![\d/])')
+
+
+def parse_result(text):
+    """
+    解析比賽結果文字，回傳 (winruns, loseruns, winline, loseline)，無法解析的部分為 None。
+    比數較大的一方視為勝隊；逐局得分的加總須與比數相符才保留 (沒打的半局為 None)
+    """
+    if not text:
+        return None, None, None, None
+
+    score = SCORE_RE.search(text)
+    line = LINE_RE.search(text[score.end():] if score else text)
+
+    lines = sums = None
+    if line:
+        lines = [
+            [None if x in ('x', 'X') else int(x) for x in re.split(r'[\s,]+', g.strip())]
+            for g in line.groups()
+        ]
+        sums = [sum(x or 0 for x in l) for l in lines]
+
+    if score:
+        a, b = int(score.group(1)), int(score.group(2))
+    elif lines:
+        a, b = sums
+    else:
+        return None, None, None, None
+
+    winruns, loseruns = max(a, b), min(a, b)
+    winline = loseline = None
+    if lines and sums == [winruns, loseruns]:
+        winline, loseline = lines
+    elif lines and sums == [loseruns, winruns]:
+        loseline, winline = lines
+    return winruns, loseruns, winline, loseline
+
+
+def scores_json(rows):
+    """
+    rows 為 [(winteam, loseteam, date, result), ...]，解析後轉成 Game.STORE_SCORES 用的 JSON；
+    沒有可解析的比分時回傳 None
+    """
+    items = []
+    for winteam, loseteam, date, result in rows:
+        winruns, loseruns, winline, loseline = parse_result(result)
+        if winruns is None:
+            continue
+        items.append({
+            'winteam': winteam, 'loseteam': loseteam, 'date': str(date), 'result': result,
+            'winruns': winruns, 'loseruns': loseruns, 'winline': winline, 'loseline': loseline
+        })
+    return json.dumps(items) if items else None
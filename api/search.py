@@ -0,0 +1,37 @@
+import click
+
+from api.sql import Search
+
+# 與 api/sql.py 中各搜尋方法相同的條件，用來檢查查詢計畫是否用到 trigram 索引
+BENCH_QUERIES = [
+    ('Player.search_players / get_all_players (name)',
+     "SELECT tname, pno, name FROM player WHERE name ILIKE %s ORDER BY tname", 1),
+    ('Player.search_players (position)',
+     "SELECT tname, pno, name FROM player WHERE position ILIKE %s ORDER BY tname", 1),
+    ('Team.search_teams (tname)',
+     "SELECT T.tName FROM team T WHERE T.tName ILIKE %s ORDER BY T.tName", 1),
+    ('Team.search_teams (chiefCoach)',
+     "SELECT T.tName FROM team T LEFT JOIN coach C ON T.chiefCoach = C.cNo WHERE C.cName ILIKE %s", 1),
+    ('Game.search_games (team)',
+     "SELECT winteam, loseteam, date, fname FROM game WHERE (winteam ILIKE %s OR loseteam ILIKE %s) ORDER BY date DESC", 2),
+    ('Game.search_games (field)',
+     "SELECT winteam, loseteam, date, fname FROM game WHERE fname ILIKE %s ORDER BY date DESC", 1),
+]
+
+
+@click.command('search-bench')
+@click.argument('keyword')
+@click.option('--verbose', '-v', is_flag=True, help='印出完整的查詢計畫')
+def search_bench_command(keyword, verbose):
+    """以 EXPLAIN ANALYZE 檢查各搜尋查詢是否使用 trigram 索引，例如: flask search-bench 王建民"""
+    if len(keyword) < Search.MIN_INDEXED_LENGTH:
+        click.echo(f"注意: 關鍵字少於 {Search.MIN_INDEXED_LENGTH} 個字元，trigram 索引用不上，預期為循序掃描")
+    pattern = Search.pattern(keyword)
+    for label, sql, n in BENCH_QUERIES:
+        plan = Search.explain(sql, (pattern,) * n)
+        used = [name for name, _, _ in Search.INDEXES if name in plan]
+        timing = [line.strip() for line in plan.splitlines() if 'Execution Time' in line]
+        status = ', '.join(used) if used else 'sequential scan'
+        click.echo(f"{label}: {status} {timing[0] if timing else ''}")
+        if verbose:
+            click.echo(plan + '\n')
@@ -1,8 +1,18 @@
+import json
 import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
 from typing import Optional
+import re
 import psycopg2
-from psycopg2 import pool
+from psycopg2 import errors, extensions
 from dotenv import load_dotenv
+from api.pool import ConnectionPool
+from api.metrics import QueryTimer
+from api.cache import TTLCache
+from api.scores import parse_result, scores_json
 #--------------------------------
 get_team_records_sql = """
 /* CTE 1: 取得所有球隊的完整列表 */
@@ -78,96 +88,353 @@ PASSWORD = os.getenv('DB_PASSWORD')
 DBNAME = os.getenv('DB_NAME')
 HOST = os.getenv('DB_HOST')
 PORT = os.getenv('DB_PORT')
+POOL_MIN = int(os.getenv('DB_POOL_MIN', 1))
+POOL_MAX = int(os.getenv('DB_POOL_MAX', 100))
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+POOL_WARMUP = int(os.getenv('DB_POOL_WARMUP', 0))
+POOL_CHECK_IDLE = float(os.getenv('DB_POOL_CHECK_IDLE', 30))
+IDENTITY_CACHE_TTL = float(os.getenv('IDENTITY_CACHE_TTL', 60))
+FORM_OPTIONS_TTL = float(os.getenv('FORM_OPTIONS_TTL', 30))
+TABLE_VERSION_TTL = float(os.getenv('TABLE_VERSION_TTL', 2))
+
+class Transaction:
+    """
+    DB.transaction() 產生的交易物件：與 DB 相同的 fetchone / fetchall / execute_input / execute_returning，
+    但全部在同一條連線上執行，離開 with 區塊時才 commit 一次
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.callbacks = []
+
+    def after_commit(self, callback):
+        # commit 成功後才執行 (例如更新 process 內的快取)，rollback 時丟棄
+        self.callbacks.append(callback)
+
+    def _run(self, sql, input, fetch):
+        timer = QueryTimer(sql)
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute(sql, input)
+                if fetch == 'one':
+                    result = cursor.fetchone()
+                elif fetch == 'all':
+                    result = cursor.fetchall()
+                else:
+                    result = None
+                timer.rows = len(result) if fetch == 'all' else cursor.rowcount
+                return result
+        except psycopg2.Error as e:
+            print(f"Error executing SQL: {e}")
+            timer.error = True
+            raise e
+        finally:
+            timer.finish()
+
+    def fetchone(self, sql, input=None):
+        return self._run(sql, input, 'one')
+
+    def fetchall(self, sql, input=None):
+        return self._run(sql, input, 'all')
+
+    def execute(self, sql):
+        self._run(sql, None, None)
+
+    def execute_input(self, sql, input):
+        if not isinstance(input, (tuple, list)):
+            raise TypeError(f"Input should be a tuple or list, got: {type(input).__name__}")
+        self._run(sql, input, None)
+
+    def execute_returning(self, sql, input):
+        if not isinstance(input, (tuple, list)):
+            raise TypeError(f"Input should be a tuple or list, got: {type(input).__name__}")
+        return self._run(sql, input, 'one')
+
+
+class PreparedConnection(extensions.connection):
+    # 記錄這條連線上已 PREPARE 過的 statement 名稱；重新連線後是新物件，自然會重新 PREPARE
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
 
 class DB:
-    connection_pool = pool.SimpleConnectionPool(
-        1, 100,  # 最小和最大連線數
-        user=USER,
-        password=PASSWORD,
-        host=HOST,
-        port=PORT,
-        dbname=DBNAME
-    )
+    # 連線池在第一次使用時才建立；fork 之後 (pid 不同) 會在子行程重建，
+    # 避免 gunicorn --preload 的 master 與 worker 共用同一條 socket
+    connection_pool = None
+    _pool_pid = None
+    _pool_lock = threading.Lock()
+    _inherited_pools = []
+
+    @staticmethod
+    def get_pool():
+        pid = os.getpid()
+        if DB.connection_pool is not None and DB._pool_pid == pid:
+            return DB.connection_pool
+        with DB._pool_lock:
+            if DB.connection_pool is None or DB._pool_pid != pid:
+                if DB.connection_pool is not None:
+                    # 父行程的連線不能在子行程 close (會把父行程的 session 一起斷掉)，
+                    # 保留參照避免被回收即可
+                    DB._inherited_pools.append(DB.connection_pool)
+                DB.connection_pool = ConnectionPool(
+                    POOL_MIN, POOL_MAX,  # 最小和最大連線數
+                    timeout=POOL_TIMEOUT,  # 連線用完時最多等待秒數
+                    check_idle=POOL_CHECK_IDLE,  # 閒置超過此秒數的連線取出前先 SELECT 1
+                    user=USER,
+                    password=PASSWORD,
+                    host=HOST,
+                    port=PORT,
+                    dbname=DBNAME,
+                    connection_factory=PreparedConnection
+                )
+                DB._pool_pid = pid
+        return DB.connection_pool
+
+    @staticmethod
+    def warm_up(n=None):
+        n = POOL_WARMUP if n is None else n
+        return DB.get_pool().warm_up(n)
 
     @staticmethod
     def connect():
-        return DB.connection_pool.getconn()
+        return DB.get_pool().getconn()
 
     @staticmethod
     def release(connection):
-        DB.connection_pool.putconn(connection)
+        DB.get_pool().putconn(connection)
+
+    @staticmethod
+    def pool_stats():
+        return DB.get_pool().stats()
+
+    @staticmethod
+    @contextmanager
+    def transaction():
+        """
+        with DB.transaction() as tx: 區塊內的查詢共用同一條連線，
+        正常結束時 commit 一次，發生例外時 rollback
+        """
+        connection = DB.connect()
+        tx = Transaction(connection)
+        try:
+            yield tx
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        finally:
+            DB.release(connection)
+        for callback in tx.callbacks:
+            callback()
 
     @staticmethod
-    def execute_input(sql, input):
+    def execute_input(sql, input, bump=None):
+        # 給 bump (表名) 時，寫入與該表版本號 +1 在同一個交易內 commit
         if not isinstance(input, (tuple, list)):
             raise TypeError(f"Input should be a tuple or list, got: {type(input).__name__}")
+        if bump:
+            with DB.transaction() as tx:
+                tx.execute_input(sql, input)
+                TableVersion.bump(bump, tx)
+            return
+        timer = QueryTimer(sql)
         connection = DB.connect()
+        timer.connected()
         try:
             with connection.cursor() as cursor:
                 cursor.execute(sql, input)
+                timer.rows = cursor.rowcount
                 connection.commit()
         except psycopg2.Error as e:
             print(f"Error executing SQL: {e}")
+            timer.error = True
             connection.rollback()
             raise e
         finally:
             DB.release(connection)
+            timer.finish()
+
+    @staticmethod
+    def execute_returning(sql, input):
+        # 寫入並 commit，回傳 RETURNING 的第一列 (沒有影響任何列時為 None)
+        if not isinstance(input, (tuple, list)):
+            raise TypeError(f"Input should be a tuple or list, got: {type(input).__name__}")
+        timer = QueryTimer(sql)
+        connection = DB.connect()
+        timer.connected()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, input)
+                row = cursor.fetchone()
+                timer.rows = cursor.rowcount
+                connection.commit()
+                return row
+        except psycopg2.Error as e:
+            print(f"Error executing SQL: {e}")
+            timer.error = True
+            connection.rollback()
+            raise e
+        finally:
+            DB.release(connection)
+            timer.finish()
 
     @staticmethod
     def execute(sql):
+        timer = QueryTimer(sql)
         connection = DB.connect()
+        timer.connected()
         try:
             with connection.cursor() as cursor:
                 cursor.execute(sql)
+                timer.rows = cursor.rowcount
+                connection.commit()
         except psycopg2.Error as e:
             print(f"Error executing SQL: {e}")
+            timer.error = True
             connection.rollback()
             raise e
         finally:
             DB.release(connection)
+            timer.finish()
+
+    @staticmethod
+    def replace_table(table, fill_sql, tx=None):
+        """
+        增量維護的彙總表 (team_standing、sales_rollup) 整張重算：鎖表、清空後以 fill_sql 重新填入，
+        在同一個交易內完成，不會與同時進行的增量更新交錯
+        """
+        (tx or DB).execute(f'LOCK TABLE {table} IN EXCLUSIVE MODE; DELETE FROM {table}; ' + fill_sql)
 
     @staticmethod
-    def fetchall(sql, input=None):
+    def stream(sql, input=None, itersize=2000):
+        """
+        以 server-side named cursor 逐批讀取 (每次 itersize 筆)，逐列 yield，
+        不會把整個結果放進記憶體；產生器結束或被關閉時才歸還連線
+        """
+        timer = QueryTimer(sql)
         connection = DB.connect()
+        timer.connected()
+        rows = 0
         try:
-            with connection.cursor() as cursor:
+            with connection.cursor(name=f"stream_{id(timer):x}") as cursor:
+                cursor.itersize = itersize
                 cursor.execute(sql, input)
-                return cursor.fetchall()
+                for row in cursor:
+                    rows += 1
+                    yield row
+            connection.commit()
         except psycopg2.Error as e:
             print(f"Error fetching data: {e}")
+            timer.error = True
+            connection.rollback()
             raise e
         finally:
+            timer.rows = rows
             DB.release(connection)
+            timer.finish()
 
     @staticmethod
-    def fetchone(sql, input=None):
+    def _positional(sql):
+        # PREPARE 需要 $1, $2 ... 形式的參數
+        counter = iter(range(1, sql.count('%s') + 1))
+        return re.sub(r'%s', lambda m: f'${next(counter)}', sql)
+
+    @staticmethod
+    def _execute_prepared(connection, cursor, name, sql, input):
+        """
+        以 PREPARE / EXECUTE 執行熱門查詢；每條連線只 PREPARE 一次。
+        伺服器端的 statement 不見了 (例如連線被重設) 或已存在時，會同步狀態後重試一次
+        """
+        input = tuple(input or ())
+        execute_sql = f"EXECUTE {name} ({', '.join(['%s'] * len(input))})" if input else f"EXECUTE {name}"
+        for attempt in range(2):
+            try:
+                if name not in connection.prepared:
+                    cursor.execute(f"PREPARE {name} AS {DB._positional(sql)}")
+                    connection.prepared.add(name)
+                cursor.execute(execute_sql, input)
+                return
+            except errors.InvalidSqlStatementName:
+                if attempt:
+                    raise
+                connection.rollback()
+                connection.prepared.discard(name)
+            except errors.DuplicatePreparedStatement:
+                if attempt:
+                    raise
+                connection.rollback()
+                connection.prepared.add(name)
+
+    @staticmethod
+    def _run(connection, cursor, sql, input, prepared):
+        if prepared and isinstance(connection, PreparedConnection):
+            DB._execute_prepared(connection, cursor, prepared, sql, input)
+        else:
+            cursor.execute(sql, input)
+
+    @staticmethod
+    def fetchall(sql, input=None, prepared=None):
+        timer = QueryTimer(sql)
         connection = DB.connect()
+        timer.connected()
         try:
             with connection.cursor() as cursor:
-                cursor.execute(sql, input)
-                return cursor.fetchone()
+                DB._run(connection, cursor, sql, input, prepared)
+                rows = cursor.fetchall()
+                timer.rows = len(rows)
+                return rows
+        except psycopg2.Error as e:
+            print(f"Error fetching data: {e}")
+            timer.error = True
+            raise e
+        finally:
+            DB.release(connection)
+            timer.finish()
+
+    @staticmethod
+    def fetchone(sql, input=None, prepared=None):
+        timer = QueryTimer(sql)
+        connection = DB.connect()
+        timer.connected()
+        try:
+            with connection.cursor() as cursor:
+                DB._run(connection, cursor, sql, input, prepared)
+                row = cursor.fetchone()
+                timer.rows = 0 if row is None else 1
+                return row
         except psycopg2.Error as e:
             print(f"Error fetching data: {e}")
+            timer.error = True
             raise e
         finally:
             DB.release(connection)
+            timer.finish()
 
 
 class Member:
+    # user_loader 每個請求都要 (identity, name)，以 mid 為鍵快取，過期或身分變更時重新查詢
+    _identity_cache = TTLCache(maxsize=10000, ttl=IDENTITY_CACHE_TTL)
+
     @staticmethod
     def get_member(account):
         sql = "SELECT account, password, mid, identity, (lname || fname) AS name FROM member WHERE account = %s"
         return DB.fetchall(sql, (account,))
 
-    @staticmethod
-    def get_all_account():
-        sql = "SELECT account FROM member"
-        return DB.fetchall(sql)
-
     @staticmethod
     def create_member(input_data):
-        sql = 'INSERT INTO member (lname, fname, account, password, identity) VALUES (%s, %s, %s, %s, %s)'
-        DB.execute_input(sql, (input_data['lname'], input_data['fname'], input_data['account'], input_data['password'], input_data['identity']))
+        """
+        新增會員，回傳新的 mid；帳號已存在時回傳 None (一次 round trip，不會有先查再寫的競爭)。
+        ON CONFLICT 依賴 member_account_key 唯一索引 (migrations/001_schema.sql)
+        """
+        sql = '''
+            INSERT INTO member (lname, fname, account, password, identity)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (account) DO NOTHING
+            RETURNING mid
+        '''
+        row = DB.execute_returning(sql, (input_data['lname'], input_data['fname'], input_data['account'], input_data['password'], input_data['identity']))
+        return row[0] if row else None
 
     @staticmethod
     def delete_product(tno, pid):
@@ -175,38 +442,93 @@ class Member:
         DB.execute_input(sql, (tno, pid))
 
     @staticmethod
-    def get_order(userid):
-        sql = 'SELECT * FROM order_list WHERE mid = %s ORDER BY ordertime DESC'
-        return DB.fetchall(sql, (userid,))
+    def get_order(userid, after=None, size=None):
+        """
+        會員的訂單 (由新到舊)。給 size 時只取一頁，after 為上一頁最後一筆的 (ordertime, oid)
+        """
+        sql = 'SELECT * FROM order_list WHERE mid = %s'
+        params = [userid]
+        if after:
+            sql += ' AND (ordertime, oid) < (%s, %s)'
+            params.extend(after)
+        sql += ' ORDER BY ordertime DESC, oid DESC'
+        if size is not None:
+            sql += ' LIMIT %s'
+            params.append(size)
+        return DB.fetchall(sql, tuple(params))
 
     @staticmethod
     def get_role(userid):
         sql = 'SELECT identity, (lname || fname) AS name FROM member WHERE mid = %s'
-        return DB.fetchone(sql, (userid,))
+        return DB.fetchone(sql, (userid,), prepared='member_get_role')
+
+    @staticmethod
+    def get_identity(userid):
+        # 與 get_role 相同的 (identity, name)，先查快取；查無此人不快取
+        key = str(userid)
+        data = Member._identity_cache.get(key)
+        if data is None:
+            data = Member.get_role(userid)
+            if data:
+                Member._identity_cache.set(key, tuple(data))
+        return data
+
+    @staticmethod
+    def cache_identity(userid, identity, name):
+        Member._identity_cache.set(str(userid), (identity, name))
+
+    @staticmethod
+    def invalidate_identity(userid):
+        # 修改會員身分 / 姓名後呼叫，下一個請求會重新查詢
+        Member._identity_cache.pop(str(userid))
 
 
 class Cart:
     @staticmethod
-    def check(user_id):
+    def check(user_id, tx=None):
         sql = '''SELECT * FROM cart, record 
                  WHERE cart.mid = %s::bigint 
                  AND cart.tno = record.tno::bigint'''
-        return DB.fetchone(sql, (user_id,))
+        return (tx or DB).fetchone(sql, (user_id,))
 
     @staticmethod
-    def get_cart(user_id):
+    def get_cart(user_id, tx=None):
         sql = 'SELECT * FROM cart WHERE mid = %s'
-        return DB.fetchone(sql, (user_id,))
+        return (tx or DB).fetchone(sql, (user_id,))
 
     @staticmethod
-    def add_cart(user_id, time):
+    def add_cart(user_id, time, tx=None):
         sql = 'INSERT INTO cart (mid, carttime, tno) VALUES (%s, %s, nextval(\'cart_tno_seq\'))'
-        DB.execute_input(sql, (user_id, time))
+        (tx or DB).execute_input(sql, (user_id, time))
+
+    @staticmethod
+    def get_or_create_tno(user_id, time, tx=None):
+        """
+        取得會員的購物車編號，沒有購物車時建立一台 (靠 cart_mid_key 唯一索引)。
+        DO UPDATE 讓既有的購物車也會 RETURNING，並鎖住該列直到交易結束，結帳 (checkout_cart) 會等這筆加入完成；
+        購物車正在結帳時等對方 commit，列被刪掉後改為新增一台
+        """
+        sql = '''
+            INSERT INTO cart (mid, carttime, tno)
+            VALUES (%s, %s, nextval('cart_tno_seq'))
+            ON CONFLICT (mid) DO UPDATE SET mid = EXCLUDED.mid
+            RETURNING tno
+        '''
+        return (tx or DB).execute_returning(sql, (user_id, time))[0]
 
     @staticmethod
-    def clear_cart(user_id):
+    def add_item(user_id, pid, time):
+        """
+        加入購物車：取得 / 建立購物車與累加明細在同一個交易內，只 commit 一次。回傳 (amount, total)
+        """
+        with DB.transaction() as tx:
+            tno = Cart.get_or_create_tno(user_id, time, tx)
+            return Record.add_item(tno, pid, tx)
+
+    @staticmethod
+    def clear_cart(user_id, tx=None):
         sql = 'DELETE FROM cart WHERE mid = %s'
-        DB.execute_input(sql, (user_id,))
+        (tx or DB).execute_input(sql, (user_id,))
 
 
 class Product:
@@ -215,6 +537,42 @@ class Product:
         sql = 'SELECT COUNT(*) FROM product'
         return DB.fetchone(sql)
 
+    @staticmethod
+    def estimate_count():
+        """
+        商品總數的估計值：讀 pg_class 的統計值，表很小或尚未 ANALYZE 時改用精確 COUNT。
+        關鍵字搜尋不計算總數 (ILIKE 的 COUNT(*) 會隨商品數成長)，分頁列只看有沒有下一頁
+        """
+        sql = "SELECT reltuples::BIGINT FROM pg_class WHERE oid = 'product'::regclass"
+        row = DB.fetchone(sql)
+        if row and row[0] >= 1000:
+            return row[0]
+        return Product.count()[0]
+
+    @staticmethod
+    def page(after_pid=None, size=9, keyword=None, offset=0):
+        """
+        依 pid 排序的分頁查詢，回傳 ([(pid, pname, price), ...], has_more)。
+        有 after_pid 時以 keyset (pid > after_pid) 取下一頁；
+        沒有時才以 offset 跳頁（例如直接點頁碼）
+        """
+        sql = 'SELECT pid, pname, price FROM product WHERE 1=1'
+        params = []
+        if keyword:
+            sql += ' AND pname ILIKE %s'
+            params.append(f'%{keyword}%')
+        if after_pid is not None:
+            sql += ' AND pid > %s'
+            params.append(after_pid)
+        sql += ' ORDER BY pid LIMIT %s'
+        params.append(size + 1)
+        if after_pid is None and offset:
+            sql += ' OFFSET %s'
+            params.append(offset)
+
+        rows = DB.fetchall(sql, tuple(params))
+        return rows[:size], len(rows) > size
+
     @staticmethod
     def get_product(pid):
         sql = 'SELECT * FROM product WHERE pid = %s'
@@ -248,103 +606,322 @@ class Product:
 
 class Record:
     @staticmethod
-    def get_total_money(tno):
+    def add_item(tno, pid, tx=None):
+        """
+        將商品加入購物車明細 (以目前售價)，已存在則數量 +1；
+        一個 statement 完成，同時加入同一商品也不會互相覆蓋 (靠 record_tno_pid_key 唯一索引)。回傳 (amount, total)
+        """
+        sql = '''
+            INSERT INTO record (pid, tno, amount, saleprice, total)
+            SELECT pid, %s, 1, price, price FROM product WHERE pid = %s
+            ON CONFLICT (tno, pid) DO UPDATE
+            SET amount = record.amount + 1,
+                total  = (record.amount + 1) * record.saleprice
+            RETURNING amount, total
+        '''
+        return (tx or DB).execute_returning(sql, (tno, pid))
+
+    @staticmethod
+    def get_total_money(tno, tx=None):
         sql = 'SELECT SUM(total) FROM record WHERE tno = %s'
-        return DB.fetchone(sql, (tno,))[0]
+        return (tx or DB).fetchone(sql, (tno,))[0]
 
     @staticmethod
-    def check_product(pid, tno):
+    def check_product(pid, tno, tx=None):
         sql = 'SELECT * FROM record WHERE pid = %s and tno = %s'
-        return DB.fetchone(sql, (pid, tno))
+        return (tx or DB).fetchone(sql, (pid, tno))
 
     @staticmethod
-    def get_price(pid):
+    def get_price(pid, tx=None):
         sql = 'SELECT price FROM product WHERE pid = %s'
-        return DB.fetchone(sql, (pid,))[0]
+        return (tx or DB).fetchone(sql, (pid,))[0]
 
     @staticmethod
-    def add_product(input_data):
+    def add_product(input_data, tx=None):
         sql = 'INSERT INTO record (pid, tno, amount, saleprice, total) VALUES (%s, %s, 1, %s, %s)'
-        DB.execute_input(sql, (input_data['pid'], input_data['tno'], input_data['saleprice'], input_data['total']))
+        (tx or DB).execute_input(sql, (input_data['pid'], input_data['tno'], input_data['saleprice'], input_data['total']))
 
     @staticmethod
-    def get_record(tno):
+    def get_record(tno, tx=None):
         sql = 'SELECT * FROM record WHERE tno = %s'
-        return DB.fetchall(sql, (tno,))
+        return (tx or DB).fetchall(sql, (tno,))
 
     @staticmethod
-    def get_amount(tno, pid):
+    def get_amount(tno, pid, tx=None):
         sql = 'SELECT amount FROM record WHERE tno = %s and pid = %s'
-        return DB.fetchone(sql, (tno, pid))[0]
+        return (tx or DB).fetchone(sql, (tno, pid))[0]
 
     @staticmethod
-    def update_product(input_data):
+    def update_product(input_data, tx=None):
         sql = 'UPDATE record SET amount = %s, total = %s WHERE pid = %s and tno = %s'
-        DB.execute_input(sql, (input_data['amount'], input_data['total'], input_data['pid'], input_data['tno']))
+        (tx or DB).execute_input(sql, (input_data['amount'], input_data['total'], input_data['pid'], input_data['tno']))
 
     @staticmethod
-    def delete_check(pid):
+    def delete_check(pid, tx=None):
         sql = 'SELECT * FROM record WHERE pid = %s'
-        return DB.fetchone(sql, (pid,))
+        return (tx or DB).fetchone(sql, (pid,))
 
     @staticmethod
-    def get_total(tno):
+    def get_total(tno, tx=None):
         sql = 'SELECT SUM(total) FROM record WHERE tno = %s'
-        return DB.fetchone(sql, (tno,))[0]
+        return (tx or DB).fetchone(sql, (tno,))[0]
 
 
 class Order_List:
     @staticmethod
-    def add_order(input_data):
-        sql = 'INSERT INTO order_list (oid, mid, ordertime, price, tno) VALUES (DEFAULT, %s, TO_TIMESTAMP(%s, %s), %s, %s)'
-        DB.execute_input(sql, (input_data['mid'], input_data['ordertime'], input_data['format'], input_data['total'], input_data['tno']))
+    def page(after=None, size=20, mid=None, tx=None):
+        """
+        訂單分頁，依 (ordertime, oid) 由新到舊。after 為上一頁最後一筆的 (ordertime, oid)；
+        回傳 ([(oid, name, price, ordertime), ...], next_after)，沒有下一頁時 next_after 為 None
+        """
+        sql = '''
+            SELECT o.oid, (m.lname || m.fname) AS name, o.price, o.ordertime
+            FROM order_list o
+            JOIN member m ON o.mid = m.mid
+            WHERE 1=1
+        '''
+        params = []
+        if mid is not None:
+            sql += " AND o.mid = %s"
+            params.append(mid)
+        if after:
+            sql += " AND (o.ordertime, o.oid) < (%s, %s)"
+            params.extend(after)
+        sql += " ORDER BY o.ordertime DESC, o.oid DESC LIMIT %s"
+        params.append(size + 1)
+
+        rows = (tx or DB).fetchall(sql, tuple(params))
+        if len(rows) > size:
+            rows = rows[:size]
+            return rows, (rows[-1][3], rows[-1][0])
+        return rows, None
+
+    @staticmethod
+    def get_details(oids, tx=None):
+        # 只取指定訂單的明細: [(oid, pname, saleprice, amount), ...]
+        if not oids:
+            return []
+        sql = '''
+            SELECT o.oid, p.pname, r.saleprice, r.amount
+            FROM order_list o
+            JOIN record r ON o.tno = r.tno
+            JOIN product p ON r.pid = p.pid
+            WHERE o.oid = ANY(%s)
+            ORDER BY o.oid, p.pname
+        '''
+        return (tx or DB).fetchall(sql, (list(oids),))
 
     @staticmethod
-    def get_order():
+    def checkout(user_id, ordertime=None):
+        """
+        結帳：一次 round trip 完成加總、新增訂單與清除購物車，回傳新的 oid；
+        沒有購物車或購物車是空的時回傳 None。
+        checkout_cart 定義在 migrations/001_schema.sql：鎖定購物車、加總明細、新增訂單、累加 sales_rollup 並移除購物車
+        """
+        sql = 'SELECT checkout_cart(%s, %s)'
+        return DB.execute_returning(sql, (user_id, ordertime or datetime.now()))[0]
+
+    @staticmethod
+    def add_order(input_data, tx=None):
+        # 新增訂單時在同一個 statement 內累加到 sales_rollup
+        sql = '''
+            WITH o AS (
+                INSERT INTO order_list (oid, mid, ordertime, price, tno)
+                VALUES (DEFAULT, %s, TO_TIMESTAMP(%s, %s), %s, %s)
+                RETURNING ordertime, price
+            )
+        ''' + SalesRollup.APPLY
+        (tx or DB).execute_input(sql, (input_data['mid'], input_data['ordertime'], input_data['format'], input_data['total'], input_data['tno']))
+
+    @staticmethod
+    def get_order(tx=None):
         sql = '''
             SELECT o.oid, (m.lname || m.fname) AS name, o.price, o.ordertime
             FROM order_list o
             NATURAL JOIN member m
             ORDER BY o.ordertime DESC
         '''
-        return DB.fetchall(sql)
+        return (tx or DB).fetchall(sql)
 
     @staticmethod
-    def get_orderdetail():
+    def get_orderdetail(tx=None):
         sql = '''
         SELECT o.oid, p.pname, r.saleprice, r.amount
         FROM order_list o
         JOIN record r ON o.tno = r.tno -- 確保兩者都是 bigint 類型
         JOIN product p ON r.pid = p.pid
         '''
-        return DB.fetchall(sql)
+        return (tx or DB).fetchall(sql)
 
 
 class Analysis:
     @staticmethod
-    def month_price(i):
-        sql = 'SELECT EXTRACT(MONTH FROM ordertime), SUM(price) FROM order_list WHERE EXTRACT(MONTH FROM ordertime) = %s GROUP BY EXTRACT(MONTH FROM ordertime)'
-        return DB.fetchall(sql, (i,))
+    def member_ranking(limit=None):
+        """
+        消費總額與訂單數一起計算: (sum, count, mid, name)，依消費總額排序。
+        先在 order_list 上依 mid 彙總 (可走 order_list_mid_price_idx 的 index-only scan)，
+        再只對彙總結果 join member；給 limit 時只取前 N 名 (top-N heapsort，不排序全部會員)
+        """
+        sql = '''
+            SELECT s.total, s.cnt, m.mid, (m.lname || m.fname) AS name
+            FROM (
+                SELECT mid, SUM(price) AS total, COUNT(*) AS cnt
+                FROM order_list
+                GROUP BY mid
+            ) s
+            JOIN member m ON m.mid = s.mid
+            WHERE m.identity = %s
+            ORDER BY s.total DESC, s.cnt DESC, m.mid
+            LIMIT %s
+        '''
+        return DB.fetchall(sql, ('user', limit))
 
     @staticmethod
-    def month_count(i):
-        sql = 'SELECT EXTRACT(MONTH FROM ordertime), COUNT(oid) FROM order_list WHERE EXTRACT(MONTH FROM ordertime) = %s GROUP BY EXTRACT(MONTH FROM ordertime)'
-        return DB.fetchall(sql, (i,))
+    def latest_order():
+        # 儀表板快取的版本號：有新訂單時才會改變 (儀表板只統計已成立的訂單)
+        # MAX(oid) 只讀 order_list_oid_idx 的最後一筆
+        sql = 'SELECT MAX(oid) FROM order_list'
+        return DB.fetchone(sql)[0]
 
     @staticmethod
     def category_sale():
-        sql = 'SELECT SUM(total), category FROM product, record WHERE product.pid = record.pid GROUP BY category'
+        # 只算已成立訂單的明細，購物車內尚未結帳的 record 不計入 (也才能以 MAX(oid) 當快取版本)
+        sql = '''
+            SELECT SUM(r.total), p.category
+            FROM order_list o
+            JOIN record r ON r.tno = o.tno
+            JOIN product p ON p.pid = r.pid
+            GROUP BY p.category
+        '''
         return DB.fetchall(sql)
 
+#----------------------------------------------
+class SalesRollup:
+    """
+    以實際日期為鍵的銷售彙總表 sales_rollup (grain, bucket, revenue, orders)，
+    grain 為 day / week / month，bucket 為該區間第一天 (week 從星期一開始)。
+    Order_List.add_order 與 checkout_cart 新增訂單時同步累加，報表只讀這張小表。
+    表定義在 migrations/001_schema.sql，空表時由 flask migrate 重建
+    """
+    GRAINS = ('day', 'week', 'month')
+
+    # 搭配名為 o (ordertime, price) 的 CTE 使用
+    APPLY = '''
+        INSERT INTO sales_rollup (grain, bucket, revenue, orders)
+        SELECT g.grain, DATE_TRUNC(g.grain, o.ordertime)::DATE, SUM(o.price), COUNT(*)
+        FROM o
+        CROSS JOIN (VALUES ('day'), ('week'), ('month')) AS g (grain)
+        GROUP BY 1, 2
+        ON CONFLICT (grain, bucket) DO UPDATE
+        SET revenue = sales_rollup.revenue + EXCLUDED.revenue,
+            orders  = sales_rollup.orders + EXCLUDED.orders
+    '''
+
     @staticmethod
-    def member_sale():
-        sql = 'SELECT SUM(price), member.mid, (member.lname || member.fname) AS name FROM order_list, member WHERE order_list.mid = member.mid AND member.identity = %s GROUP BY member.mid, member.lname, member.fname ORDER BY SUM(price) DESC'
-        return DB.fetchall(sql, ('user',))
+    def rebuild():
+        DB.replace_table('sales_rollup', 'WITH o AS (SELECT ordertime, price FROM order_list) ' + SalesRollup.APPLY)
 
     @staticmethod
-    def member_sale_count():
-        sql = 'SELECT COUNT(*), member.mid, (member.lname || member.fname) AS name FROM order_list, member WHERE order_list.mid = member.mid AND member.identity = %s GROUP BY member.mid, member.lname, member.fname ORDER BY COUNT(*) DESC'
-        return DB.fetchall(sql, ('user',))
+    def get_range(grain, date_from=None, date_to=None):
+        """
+        回傳 [(bucket, revenue, orders), ...]，包含與 [date_from, date_to] 重疊的區間，依日期排序
+        """
+        if grain not in SalesRollup.GRAINS:
+            raise ValueError(f"unknown grain: {grain}")
+        sql = 'SELECT bucket, revenue, orders FROM sales_rollup WHERE grain = %s'
+        params = [grain]
+        if date_from:
+            sql += ' AND bucket >= DATE_TRUNC(%s, %s::DATE)::DATE'
+            params.extend([grain, date_from])
+        if date_to:
+            sql += ' AND bucket <= %s::DATE'
+            params.append(date_to)
+        sql += ' ORDER BY bucket'
+        return DB.fetchall(sql, tuple(params))
+
+#----------------------------------------------
+class TableVersion:
+    """
+    每張表的版本號 (table_version)，api/sql.py 的寫入方法在同一個交易內 bump()。
+    讀取時整張表一次查回並在 process 內快取 TABLE_VERSION_TTL 秒，
+    所以 ETag / 快取鍵的檢查通常不需要連線資料庫；本 process 的寫入會立即反映
+    """
+    _versions = {}
+    _expires = 0.0
+    _lock = threading.Lock()
+
+    BUMP = '''
+        INSERT INTO table_version (tname, version) VALUES (%s, 1)
+        ON CONFLICT (tname) DO UPDATE SET version = table_version.version + 1
+        RETURNING version
+    '''
+
+    @staticmethod
+    def bump(table, tx=None):
+        """
+        版本號 +1 並回傳新的版本號。給 tx 時與寫入在同一個交易內，
+        commit 之後才更新本 process 的快取，寫入失敗時不會留下沒有 commit 的版本號
+        """
+        version = (tx or DB).execute_returning(TableVersion.BUMP, (table,))[0]
+        if tx:
+            tx.after_commit(lambda: TableVersion.remember(table, version))
+        else:
+            TableVersion.remember(table, version)
+        return version
+
+    @staticmethod
+    def remember(table, version):
+        # 本 process 剛 commit 的版本號，不必等 TABLE_VERSION_TTL 過期
+        with TableVersion._lock:
+            TableVersion._versions[table] = version
+
+    @staticmethod
+    def get(*tables):
+        # 回傳各表版本號的 tuple；沒有寫入過的表為 0
+        now = time.monotonic()
+        if now >= TableVersion._expires:
+            rows = DB.fetchall('SELECT tname, version FROM table_version')
+            with TableVersion._lock:
+                TableVersion._versions = {r[0]: r[1] for r in rows}
+                TableVersion._expires = now + TABLE_VERSION_TTL
+        with TableVersion._lock:
+            return tuple(TableVersion._versions.get(t, 0) for t in tables)
+
+#----------------------------------------------
+class Search:
+    """
+    子字串搜尋 (ILIKE '%kw%') 共用的 pg_trgm GIN 索引。
+    所有球員 / 球隊 / 賽局的搜尋都透過 Search.pattern() 產生參數，
+    索引定義在 migrations/002_trgm_indexes.sql (CREATE INDEX CONCURRENTLY，由 flask migrate 逐句執行)，請求路徑上不建索引。
+    注意：trigram 至少要 3 個字元，1–2 個字的關鍵字 (例如單一中文姓氏) 無法用索引，會退回循序掃描
+    """
+    # 關鍵字至少要這麼長 trigram 索引才用得上
+    MIN_INDEXED_LENGTH = 3
+
+    # (索引名稱, 資料表, 欄位)，與 migrations/002_trgm_indexes.sql 相同
+    INDEXES = [
+        ('player_name_trgm_idx', 'player', 'name'),
+        ('player_tname_trgm_idx', 'player', 'tname'),
+        ('player_position_trgm_idx', 'player', 'position'),
+        ('team_tname_trgm_idx', 'team', 'tname'),
+        ('team_companyname_trgm_idx', 'team', 'companyname'),
+        ('coach_cname_trgm_idx', 'coach', 'cname'),
+        ('game_winteam_trgm_idx', 'game', 'winteam'),
+        ('game_loseteam_trgm_idx', 'game', 'loseteam'),
+        ('game_fname_trgm_idx', 'game', 'fname'),
+    ]
+
+    @staticmethod
+    def pattern(keyword):
+        # 跳脫 LIKE 的萬用字元，使用者輸入的 % 與 _ 當成一般字元比對
+        escaped = str(keyword).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return f'%{escaped}%'
+
+    @staticmethod
+    def explain(sql, params=None):
+        # 回傳 EXPLAIN ANALYZE 的文字計畫，供 flask search-bench 檢查是否用到索引
+        rows = DB.fetchall('EXPLAIN (ANALYZE, BUFFERS) ' + sql, params)
+        return '\n'.join(r[0] for r in rows)
 
 #----------------------------------------------
 class Team:
@@ -392,16 +969,16 @@ class Team:
 
         if tName:
             sql += " AND T.tName ILIKE %s"
-            params.append(f"%{tName}%")
+            params.append(Search.pattern(tName))
 
         if chiefCoach:
             # 修正: 搜尋條件需針對教練姓名 (C.cName) 進行
             sql += " AND C.cName ILIKE %s"
-            params.append(f"%{chiefCoach}%")
+            params.append(Search.pattern(chiefCoach))
 
         if companyName:
             sql += " AND T.companyName ILIKE %s"
-            params.append(f"%{companyName}%")
+            params.append(Search.pattern(companyName))
 
         sql += " ORDER BY T.tName"
 
@@ -425,7 +1002,7 @@ class Team:
                    coach C ON T.chiefCoach = C.cNo
               WHERE T.tName = %s 
               '''
-        return DB.fetchone(sql, (tName,))
+        return DB.fetchone(sql, (tName,), prepared='team_get_team_detail')
 
     @staticmethod
     def add_team(data):
@@ -440,7 +1017,7 @@ class Team:
             data.get('cPhone', None),
             data.get('cAddress', None),
             data.get('fName', None)
-        ))
+        ), bump='team')
 
     @staticmethod
     def update_team(data):
@@ -454,15 +1031,21 @@ class Team:
                   fname       = %s
               WHERE tname = %s \
               '''
-        DB.execute_input(sql, (
-            data.get('tName'),
-            data.get('chiefCoach', None),
-            data.get('companyName', None),
-            data.get('cPhone', None),
-            data.get('cAddress', None),
-            data.get('fName', None),
-            data.get('oldTName')
-        ))
+        # 更新、重建戰績表與版本號 +1 在同一個交易內
+        with DB.transaction() as tx:
+            tx.execute_input(sql, (
+                data.get('tName'),
+                data.get('chiefCoach', None),
+                data.get('companyName', None),
+                data.get('cPhone', None),
+                data.get('cAddress', None),
+                data.get('fName', None),
+                data.get('oldTName')
+            ))
+            # 隊名變更時 team_standing 以隊名為鍵，直接重建（隊伍改名很少發生）
+            if data.get('tName') != data.get('oldTName'):
+                TeamStanding.rebuild(tx)
+            TableVersion.bump('team', tx)
 
 
 # -------------------------------
@@ -490,7 +1073,7 @@ class Player:
                   WHERE name ILIKE %s
                   ORDER BY tname \
                   '''
-            return DB.fetchall(sql, (f'%{keyword}%',))
+            return DB.fetchall(sql, (Search.pattern(keyword),))
         else:
             sql = '''
                   SELECT tname, \
@@ -515,7 +1098,7 @@ class Player:
                 WHERE tname = %s AND name ILIKE %s
                 ORDER BY pno
             '''
-            return DB.fetchall(sql, (tName, f'%{keyword}%',))
+            return DB.fetchall(sql, (tName, Search.pattern(keyword),))
         else:
             sql = '''
                 SELECT pno, name, position, height, weight, education
@@ -525,6 +1108,28 @@ class Player:
             '''
             return DB.fetchall(sql, (tName,))
 
+    @staticmethod
+    def get_players_for_teams(team_names, keyword=None):
+        """
+        一次查詢取得多隊球員，回傳 {tname: [(pno, name, position, height, weight, education), ...]}，
+        每隊球員依背號排序；沒有符合球員的隊伍不會出現在結果中
+        """
+        sql = '''
+            SELECT tname, pno, name, position, height, weight, education
+            FROM player
+            WHERE tname = ANY(%s)
+        '''
+        params = [list(team_names)]
+        if keyword:
+            sql += " AND name ILIKE %s"
+            params.append(Search.pattern(keyword))
+        sql += " ORDER BY tname, pno"
+
+        roster = {}
+        for r in DB.fetchall(sql, tuple(params)):
+            roster.setdefault(r[0], []).append(r[1:])
+        return roster
+
     @staticmethod
     def get_player(tName, pNo):
         sql = '''
@@ -532,7 +1137,7 @@ class Player:
             FROM player
             WHERE tname = %s AND pno = %s
         '''
-        return DB.fetchone(sql, (tName, pNo))
+        return DB.fetchone(sql, (tName, pNo), prepared='player_get_player')
 
     @staticmethod
     def add_player(data):
@@ -543,7 +1148,7 @@ class Player:
         DB.execute_input(sql, (
             data['tName'], data['pNo'], data['name'], data['birthday'],
             data['position'], data['height'], data['weight'], data['education']
-        ))
+        ), bump='player')
 
     @staticmethod
     def update_player(input_data):
@@ -570,12 +1175,12 @@ class Player:
             input_data['education'],
             input_data['tName'],
             input_data['pNo']
-        ))
+        ), bump='player')
 
     @staticmethod
     def delete_player(pNo):
         sql = "DELETE FROM player WHERE pno = %s"
-        DB.execute_input(sql, (pNo,))
+        DB.execute_input(sql, (pNo,), bump='player')
 
     @staticmethod
     def search_players(team=None, keyword=None, position=None):
@@ -587,13 +1192,13 @@ class Player:
         params = []
         if team:
             sql += " AND tname ILIKE %s"
-            params.append(f'%{team}%')
+            params.append(Search.pattern(team))
         if keyword:
             sql += " AND name ILIKE %s"
-            params.append(f'%{keyword}%')
+            params.append(Search.pattern(keyword))
         if position:
             sql += " AND position ILIKE %s"
-            params.append(f'%{position}%')
+            params.append(Search.pattern(position))
 
         sql += " ORDER BY tname"
         return DB.fetchall(sql, tuple(params))
@@ -629,7 +1234,7 @@ class Coach:
         '''
         DB.execute_input(sql, (
             data['cNo'], data['cName'], data['birthday'], data['tName']
-        ))
+        ), bump='coach')
 
     @staticmethod
     def update_coach(data):
@@ -640,12 +1245,12 @@ class Coach:
         '''
         DB.execute_input(sql, (
             data['cName'], data['birthday'], data['tName'], data['cNo']
-        ))
+        ), bump='coach')
 
     @staticmethod
     def delete_coach(cNo):
         sql = "DELETE FROM coach WHERE cno = %s"
-        DB.execute_input(sql, (cNo,))
+        DB.execute_input(sql, (cNo,), bump='coach')
 
     @staticmethod
     def get_coaches_by_team(tName):
@@ -662,6 +1267,71 @@ class Coach:
 # Game 賽局管理
 # -------------------------------
 class Game:
+    # 以 JSON 陣列一次寫入多場比賽解析後的比分 (格式見 api.scores.scores_json)；result 已被改掉的比賽不更新
+    STORE_SCORES = '''
+        UPDATE game g
+        SET winruns  = v.winruns,
+            loseruns = v.loseruns,
+            winline  = v.winline,
+            loseline = v.loseline
+        FROM JSONB_TO_RECORDSET(%s::JSONB) AS v (
+            winteam TEXT, loseteam TEXT, date DATE, result TEXT,
+            winruns INT, loseruns INT, winline INT[], loseline INT[]
+        )
+        WHERE g.winteam = v.winteam
+          AND g.loseteam = v.loseteam
+          AND g.date = v.date
+          AND g.result = v.result
+    '''
+
+    @staticmethod
+    def backfill_scores():
+        # 解析欄位新增前就存在、或由其他途徑寫入而尚未解析的比賽，回傳解析出比分的筆數
+        rows = DB.fetchall('''
+            SELECT winteam, loseteam, date, result
+            FROM game
+            WHERE result IS NOT NULL AND winruns IS NULL
+        ''')
+        scores = scores_json(rows)
+        if not scores:
+            return 0
+        DB.execute_input(Game.STORE_SCORES, (scores,))
+        return len(json.loads(scores))
+
+    @staticmethod
+    def page(after=None, size=50, team=None, field=None, date_from=None, date_to=None):
+        """
+        賽局分頁，依 (date, winteam, loseteam) 由新到舊排序。
+        after 為上一頁最後一筆的 (date, winteam, loseteam)；回傳 (rows, next_after)，
+        沒有下一頁時 next_after 為 None。球隊 / 球場為完全比對，日期區間含頭尾
+        """
+        sql = "SELECT winteam, loseteam, date, fname FROM game WHERE 1=1"
+        params = []
+        if team:
+            sql += " AND (winteam = %s OR loseteam = %s)"
+            params.extend([team, team])
+        if field:
+            sql += " AND fname = %s"
+            params.append(field)
+        if date_from:
+            sql += " AND date >= %s"
+            params.append(date_from)
+        if date_to:
+            sql += " AND date <= %s"
+            params.append(date_to)
+        if after:
+            sql += " AND (date, winteam, loseteam) < (%s, %s, %s)"
+            params.extend(after)
+        sql += " ORDER BY date DESC, winteam DESC, loseteam DESC LIMIT %s"
+        params.append(size + 1)
+
+        rows = DB.fetchall(sql, tuple(params))
+        if len(rows) > size:
+            rows = rows[:size]
+            last = rows[-1]
+            return rows, (last[2], last[0], last[1])
+        return rows, None
+
     @staticmethod
     def get_all_games():
         sql = '''
@@ -674,24 +1344,25 @@ class Game:
     @staticmethod
     def get_more_info(winTeam, loseTeam, date):
         sql = '''
-              SELECT winteam, loseteam, date, fname, result
+              SELECT winteam, loseteam, date, fname, result, winruns, loseruns, winline, loseline
               FROM game
               WHERE winteam = %s \
                 AND loseteam = %s \
                 AND date = %s \
               '''
-        return DB.fetchone(sql, (winTeam, loseTeam, date))  # ✅ fetchone
+        return DB.fetchone(sql, (winTeam, loseTeam, date), prepared='game_get_more_info')  # ✅ fetchone
 
     @staticmethod
     def search_games(team=None, field=None, date=None):
         sql = "SELECT winteam, loseteam, date, fname FROM game WHERE 1=1"
         params = []
         if team:
+            # 兩個欄位各自有 trigram 索引，planner 可以 BitmapOr 合併
             sql += " AND (winteam ILIKE %s OR loseteam ILIKE %s)"
-            params.extend([f"%{team}%", f"%{team}%"])
+            params.extend([Search.pattern(team), Search.pattern(team)])
         if field:
             sql += " AND fname ILIKE %s"
-            params.append(f"%{field}%")
+            params.append(Search.pattern(field))
         if date:
             sql += " AND date = %s"
             params.append(date)
@@ -700,37 +1371,77 @@ class Game:
 
     @staticmethod
     def add_game(data):
+        # 新增賽局並在同一個 statement 內累加 team_standing 的勝敗場；比分在寫入時解析一次
+        scores = parse_result(data['result'])
         sql = '''
-            INSERT INTO game (winteam, loseteam, date, fname, result)
-            VALUES (%s, %s, %s, %s, %s)
-        '''
+            WITH g AS (
+                INSERT INTO game (winteam, loseteam, date, fname, result, winruns, loseruns, winline, loseline)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING winteam, loseteam
+            ),
+            delta AS (
+        ''' + TeamStanding.delta_rows('g', 1) + '''
+            )
+        ''' + TeamStanding.APPLY_DELTA
         DB.execute_input(sql, (
-            data['winTeam'], data['loseTeam'], data['date'], data['fName'], data['result']
-        ))
+            data['winTeam'], data['loseTeam'], data['date'], data['fName'], data['result'], *scores
+        ), bump='game')
 
     @staticmethod
     def update_game(data):
+        # 舊的勝敗 -1、新的勝敗 +1，戰績表只做增量調整；比分重新解析
+        scores = parse_result(data['result'])
         sql = '''
-              UPDATE game
-              SET winteam  = %s,
-                  loseteam = %s,
-                  date     = %s,
-                  fname    = %s,
-                  result   = %s
-              WHERE winteam = %s \
-                AND loseteam = %s \
-                AND date = %s \
-              '''
+              WITH old AS (
+                  SELECT winteam, loseteam
+                  FROM game
+                  WHERE winteam = %s
+                    AND loseteam = %s
+                    AND date = %s
+                  FOR UPDATE
+              ),
+              g AS (
+                  UPDATE game
+                  SET winteam  = %s,
+                      loseteam = %s,
+                      date     = %s,
+                      fname    = %s,
+                      result   = %s,
+                      winruns  = %s,
+                      loseruns = %s,
+                      winline  = %s,
+                      loseline = %s
+                  WHERE winteam = %s
+                    AND loseteam = %s
+                    AND date = %s
+                  RETURNING winteam, loseteam
+              ),
+              delta AS (
+              ''' + TeamStanding.delta_rows('g', 1) + '''
+                  UNION ALL
+              ''' + TeamStanding.delta_rows('old', -1) + '''
+              )
+              ''' + TeamStanding.APPLY_DELTA
         DB.execute_input(sql, (
+            data['oldWinTeam'], data['oldLoseTeam'], data['oldDate'],
             data['winTeam'], data['loseTeam'], data['date'],
-            data['fName'], data['result'],
+            data['fName'], data['result'], *scores,
             data['oldWinTeam'], data['oldLoseTeam'], data['oldDate']
-        ))
+        ), bump='game')
 
     @staticmethod
     def delete_game(winTeam, loseTeam, date):
-        sql = "DELETE FROM game WHERE winteam = %s AND loseteam = %s AND date = %s"
-        DB.execute_input(sql, (winTeam, loseTeam, date))
+        sql = '''
+            WITH g AS (
+                DELETE FROM game
+                WHERE winteam = %s AND loseteam = %s AND date = %s
+                RETURNING winteam, loseteam
+            ),
+            delta AS (
+        ''' + TeamStanding.delta_rows('g', -1) + '''
+            )
+        ''' + TeamStanding.APPLY_DELTA
+        DB.execute_input(sql, (winTeam, loseTeam, date), bump='game')
 
 class Field:
     @staticmethod
@@ -759,7 +1470,7 @@ class Field:
         '''
         DB.execute_input(sql, (
             data['fId'], data['fName'], data['address']
-        ))
+        ), bump='field')
 
     @staticmethod
     def update_field(data):
@@ -770,17 +1481,45 @@ class Field:
         '''
         DB.execute_input(sql, (
             data['fName'], data['address'], data['fId']
-        ))
+        ), bump='field')
 
     @staticmethod
     def delete_field(fId):
         sql = "DELETE FROM field WHERE fid = %s"
-        DB.execute_input(sql, (fId,))
+        DB.execute_input(sql, (fId,), bump='field')
+
+
+class FormOptions:
+    """
+    後台表單下拉選單的資料 (球隊、球場、教練)，
+    以 json_agg 一次查回並短暫快取；快取鍵含 team / field / coach 的版本號，有寫入就會重查
+    """
+    _cache = TTLCache(maxsize=4, ttl=FORM_OPTIONS_TTL)
+
+    @staticmethod
+    def load():
+        key = TableVersion.get('team', 'field', 'coach')
+        return FormOptions._cache.get_or_set(key, FormOptions._query)
+
+    @staticmethod
+    def _query():
+        sql = '''
+            SELECT
+                (SELECT COALESCE(json_agg(tname ORDER BY tname), '[]') FROM team),
+                (SELECT COALESCE(json_agg(json_build_object('fid', fid, 'fname', fname) ORDER BY fid), '[]')
+                 FROM field),
+                (SELECT COALESCE(json_agg(json_build_object('cno', cno, 'cname', cname) ORDER BY tname), '[]')
+                 FROM coach)
+        '''
+        teams, fields, coaches = DB.fetchone(sql)
+        return {'teams': teams, 'fields': fields, 'coaches': coaches}
+
 #--------------------------------------
 class TeamRecord:
     """
     球隊戰績功能：
     顯示每隊的勝場、敗場、勝率與勝差
+    (全表聚合，僅供 TeamStanding 重建與驗證使用；頁面請讀 TeamStanding)
     """
     @staticmethod
     def get_team_records():
@@ -815,3 +1554,96 @@ class TeamRecord:
         """
         return DB.fetchall(sql)
 
+
+
+class TeamStanding:
+    """
+    增量維護的戰績表 team_standing (tname, wins, losses)：
+    Game 的新增 / 修改 / 刪除只調整受影響球隊的勝敗數，
+    /race 只讀這張小表，不再掃描整個 game。
+    TeamRecord.get_team_records() 的全表聚合只用在 rebuild 與 verify。
+    表定義在 migrations/001_schema.sql，空表時由 flask migrate 重建
+    """
+
+    # 搭配名為 delta (tname, wins, losses) 的 CTE 使用
+    APPLY_DELTA = '''
+        INSERT INTO team_standing (tname, wins, losses)
+        SELECT tname, SUM(wins), SUM(losses)
+        FROM delta
+        GROUP BY tname
+        ON CONFLICT (tname) DO UPDATE
+        SET wins   = team_standing.wins + EXCLUDED.wins,
+            losses = team_standing.losses + EXCLUDED.losses
+    '''
+
+    @staticmethod
+    def delta_rows(source, sign):
+        """
+        由含有 winteam / loseteam 欄位的 CTE 產生 (tname, wins, losses) 增量列，
+        sign 為 1 (加入比賽) 或 -1 (移除比賽)
+        """
+        return f'''
+            SELECT winteam AS tname, {int(sign)} AS wins, 0 AS losses
+            FROM {source} WHERE winteam IS NOT NULL
+            UNION ALL
+            SELECT loseteam AS tname, 0 AS wins, {int(sign)} AS losses
+            FROM {source} WHERE loseteam IS NOT NULL
+        '''
+
+    @staticmethod
+    def rebuild(tx=None):
+        DB.replace_table('team_standing', '''
+            WITH delta AS (
+        ''' + TeamStanding.delta_rows('game', 1) + '''
+            )
+        ''' + TeamStanding.APPLY_DELTA, tx)
+
+    @staticmethod
+    def verify():
+        """
+        與全表聚合結果比對，回傳不一致的球隊清單 [(team_name, (wins, losses), (wins, losses))]
+        """
+        stored = {r[0]: (r[1], r[2]) for r in TeamStanding.get_standings()}
+        mismatches = []
+        for r in TeamRecord.get_team_records():
+            expected = (r[1], r[2])
+            actual = stored.get(r[0], (0, 0))
+            if expected != actual:
+                mismatches.append((r[0], expected, actual))
+        return mismatches
+
+    @staticmethod
+    def get_standings():
+        """
+        回傳 (team_name, wins, losses, win_rate, games_behind)，
+        勝差以排名第一的球隊為基準: [(領先者勝 - 自己勝) + (自己敗 - 領先者敗)] / 2
+        """
+        sql = '''
+            WITH merged AS (
+                SELECT
+                    t.tname AS team_name,
+                    COALESCE(s.wins, 0) AS wins,
+                    COALESCE(s.losses, 0) AS losses
+                FROM team t
+                LEFT JOIN team_standing s ON s.tname = t.tname
+            ),
+            rated AS (
+                SELECT
+                    team_name, wins, losses,
+                    ROUND(COALESCE(wins::NUMERIC / NULLIF(wins + losses, 0), 0), 3) AS win_rate
+                FROM merged
+            )
+            SELECT
+                team_name,
+                wins,
+                losses,
+                win_rate,
+                ROUND(
+                    ((FIRST_VALUE(wins) OVER leader - wins)
+                     + (losses - FIRST_VALUE(losses) OVER leader)) / 2.0,
+                1) AS games_behind
+            FROM rated
+            WINDOW leader AS (ORDER BY win_rate DESC, wins DESC)
+            ORDER BY win_rate DESC, wins DESC
+        '''
+        return DB.fetchall(sql)
@@ -0,0 +1,259 @@
+import itertools
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from api.cache import TTLCache
+from api.sql import DB, TableVersion
+
+# 對戰矩陣與得失分的快取筆數 (不同日期區間各佔一筆)
+H2H_CACHE_SIZE = int(os.getenv('H2H_CACHE_SIZE', 64))
+
+# 畢氏期望勝率的指數
+PYTHAG_EXPONENT = 1.83
+
+# teams: 球隊名稱 (依名稱排序)，win / lose: 每場比賽勝隊 / 敗隊在 teams 中的編號，dates: 比賽日期 (已排序)，
+# win_runs / lose_runs: 勝隊 / 敗隊得分 (沒有比分的比賽為 nan)
+GameArrays = namedtuple('GameArrays', ['teams', 'win', 'lose', 'dates', 'win_runs', 'lose_runs'])
+
+# 一個球季 (年度) 的累計戰績：days 為該季有比賽的日期 (已排序)，
+# wins / losses 為 (len(days), len(teams)) 的累計勝敗場數，trend 為 trend() 的結果
+History = namedtuple('History', ['season', 'teams', 'days', 'wins', 'losses', 'trend'])
+
+# 快取鍵都含 team / game 的版本號，賽局或球隊異動後自然失效
+_games_cache = TTLCache(maxsize=4)
+_matrix_cache = TTLCache(maxsize=H2H_CACHE_SIZE)
+_history_cache = TTLCache(maxsize=8)
+_runs_cache = TTLCache(maxsize=H2H_CACHE_SIZE)
+_season_cache = TTLCache(maxsize=2)
+
+
+def _versions():
+    return TableVersion.get('team', 'game')
+
+
+def _load_games(season=None):
+    sql = '''
+        SELECT winteam, loseteam, date::DATE, winruns, loseruns
+        FROM game
+        WHERE winteam IS NOT NULL AND loseteam IS NOT NULL AND date IS NOT NULL
+    '''
+    params = ()
+    if season is not None:
+        # 下一季第一天為上界，date 是 DATE 或 TIMESTAMP 都能用索引
+        sql += ' AND date >= %s AND date < %s'
+        params = (season_range(season)[0], season_range(season + 1)[0])
+    rows = DB.fetchall(sql + ' ORDER BY date', params)
+    names = {r[0] for r in DB.fetchall('SELECT tname FROM team')}
+    teams = sorted(names.union(r[0] for r in rows).union(r[1] for r in rows))
+    index = {t: i for i, t in enumerate(teams)}
+
+    win = np.fromiter((index[r[0]] for r in rows), dtype=np.int64, count=len(rows))
+    lose = np.fromiter((index[r[1]] for r in rows), dtype=np.int64, count=len(rows))
+    dates = np.array([r[2] for r in rows], dtype='datetime64[D]')
+    win_runs = np.array([np.nan if r[3] is None else r[3] for r in rows], dtype=np.float64)
+    lose_runs = np.array([np.nan if r[4] is None else r[4] for r in rows], dtype=np.float64)
+    return GameArrays(teams, win, lose, dates, win_runs, lose_runs)
+
+
+def load_games(season=None):
+    """
+    game 表只讀一次並轉成整數編碼的陣列，直到 team / game 版本改變才重新載入。
+    給 season 時只載入該季的比賽
+    """
+    return _games_cache.get_or_set((_versions(), season), lambda: _load_games(season))
+
+
+def _games_between(date_from, date_to):
+    # 區間頭尾在同一季時只需要載入該季
+    if date_from and date_to and season_of(date_from) == season_of(date_to):
+        return load_games(season_of(date_from))
+    return load_games()
+
+
+def date_slice(dates, date_from=None, date_to=None):
+    # dates 已排序，用二分搜尋取出 [date_from, date_to] (含頭尾) 的範圍
+    lo = 0 if not date_from else np.searchsorted(dates, np.datetime64(date_from, 'D'), side='left')
+    hi = len(dates) if not date_to else np.searchsorted(dates, np.datetime64(date_to, 'D'), side='right')
+    return slice(lo, hi)
+
+
+def win_matrix(date_from=None, date_to=None):
+    """
+    對戰勝場矩陣，回傳 (teams, m)：m[i, j] 為 teams[i] 勝 teams[j] 的場數。
+    日期區間含頭尾，格式錯誤時丟出 ValueError。回傳的矩陣是唯讀的
+    """
+    def build():
+        games = _games_between(date_from, date_to)
+        n = len(games.teams)
+        s = date_slice(games.dates, date_from, date_to)
+        m = np.bincount(games.win[s] * n + games.lose[s], minlength=n * n).reshape(n, n)
+        m.setflags(write=False)
+        return games.teams, m
+
+    key = (_versions(), str(date_from or ''), str(date_to or ''))
+    return _matrix_cache.get_or_set(key, build)
+
+
+def head_to_head(team_a, team_b, date_from=None, date_to=None):
+    # 回傳 (team_a 勝 team_b 的場數, team_b 勝 team_a 的場數)
+    teams, m = win_matrix(date_from, date_to)
+    index = {t: i for i, t in enumerate(teams)}
+    if team_a not in index or team_b not in index:
+        return 0, 0
+    a, b = index[team_a], index[team_b]
+    return int(m[a, b]), int(m[b, a])
+
+
+def tiebreak(standings, date_from=None, date_to=None):
+    """
+    勝率相同的球隊依彼此之間的對戰淨勝場排序，相同時維持原本順序。
+    standings 為 TeamStanding.get_standings() 或 standings_on() 的結果 (已依勝率排序)，
+    date_from / date_to 限制計入的對戰日期 (含頭尾)
+    """
+    teams, m = win_matrix(date_from, date_to)
+    index = {t: i for i, t in enumerate(teams)}
+
+    result = []
+    for _, group in itertools.groupby(standings, key=lambda r: r[3]):
+        group = list(group)
+        idx = [index.get(r[0]) for r in group]
+        if len(group) > 1 and None not in idx:
+            sub = m[np.ix_(idx, idx)]
+            net = sub.sum(axis=1) - sub.sum(axis=0)
+            group = [group[k] for k in sorted(range(len(group)), key=lambda k: -net[k])]
+        result.extend(group)
+    return result
+
+
+def season_of(date):
+    # 球季以年度區分；日期格式錯誤時丟出 ValueError
+    return np.datetime64(date, 'D').astype(object).year
+
+
+def season_range(season):
+    return f'{season:04d}-01-01', f'{season:04d}-12-31'
+
+
+def latest_season():
+    # 最後一場比賽所在的球季，沒有比賽時為今年
+    def query():
+        row = DB.fetchone('SELECT MAX(date)::DATE FROM game WHERE date IS NOT NULL')
+        return row[0].year if row and row[0] else np.datetime64('today', 'D').astype(object).year
+
+    return _season_cache.get_or_set(_versions(), query)
+
+
+def _rates(wins, losses):
+    # 與 TeamStanding.get_standings() 相同：勝率取到小數第三位，沒有比賽為 0
+    played = wins + losses
+    rate = np.divide(wins, played, out=np.zeros(wins.shape), where=played > 0)
+    return np.round(rate, 3)
+
+
+def _games_behind(wins, losses, rate):
+    # 領先者為勝率最高 (同勝率取勝場多) 的球隊，最後一軸為球隊
+    leader = np.lexsort((wins, rate), axis=-1)[..., -1:]
+    lw = np.take_along_axis(wins, leader, axis=-1)
+    ll = np.take_along_axis(losses, leader, axis=-1)
+    return ((lw - wins) + (losses - ll)) / 2.0
+
+
+def _build_history(season):
+    # 只載入該季的比賽
+    games = load_games(season)
+    n = len(games.teams)
+    days, day_index = np.unique(games.dates, return_inverse=True)
+
+    # 該季每天每隊的勝敗場數，再沿日期方向做 prefix sum (每季從 0 開始累計)
+    wins = np.zeros((len(days), n), dtype=np.int64)
+    losses = np.zeros((len(days), n), dtype=np.int64)
+    np.add.at(wins, (day_index, games.win), 1)
+    np.add.at(losses, (day_index, games.lose), 1)
+    np.cumsum(wins, axis=0, out=wins)
+    np.cumsum(losses, axis=0, out=losses)
+    for a in (wins, losses):
+        a.setflags(write=False)
+
+    # 走勢圖資料與累計表一起算好快取
+    rate = _rates(wins, losses)
+    gb = _games_behind(wins, losses, rate)
+    trend = (
+        [str(d) for d in days],
+        {t: rate[:, k].tolist() for k, t in enumerate(games.teams)},
+        {t: gb[:, k].tolist() for k, t in enumerate(games.teams)}
+    )
+    return History(season, games.teams, days, wins, losses, trend)
+
+
+def history(season):
+    """
+    一個球季的累計戰績表：該季比賽依日期排序一次、每個比賽日每隊一列累計勝敗，
+    直到 team / game 版本改變才重新計算
+    """
+    return _history_cache.get_or_set((_versions(), season), lambda: _build_history(season))
+
+
+def standings_on(date):
+    """
+    指定日期 (含當天比賽) 在該季的戰績，格式與 TeamStanding.get_standings() 相同：
+    [(team_name, wins, losses, win_rate, games_behind), ...]，依勝率、勝場排序。
+    日期格式錯誤時丟出 ValueError
+    """
+    h = history(season_of(date))
+    i = np.searchsorted(h.days, np.datetime64(date, 'D'), side='right') - 1
+    if i < 0:
+        wins = np.zeros(len(h.teams), dtype=np.int64)
+        losses = np.zeros(len(h.teams), dtype=np.int64)
+    else:
+        wins, losses = h.wins[i], h.losses[i]
+
+    rate = _rates(wins, losses)
+    gb = _games_behind(wins, losses, rate)
+    order = np.lexsort((-wins, -rate))
+    return [
+        (h.teams[k], int(wins[k]), int(losses[k]), float(rate[k]), float(gb[k]))
+        for k in order
+    ]
+
+
+def trend(season):
+    """
+    該季走勢圖資料 (與累計戰績一起快取)：回傳 (days, win_rate, games_behind)，
+    days 為 'YYYY-MM-DD' 字串，win_rate / games_behind 為 {team_name: [每個比賽日的值]}
+    """
+    return history(season).trend
+
+
+def run_stats(date_from=None, date_to=None):
+    """
+    各隊得失分 (只計有比分的比賽)，回傳
+    {team_name: {'runs_for', 'runs_against', 'run_diff', 'pythag'}}，
+    pythag 為畢氏期望勝率 RF^k / (RF^k + RA^k)。與戰績一樣快取到 team / game 版本改變
+    """
+    def build():
+        games = _games_between(date_from, date_to)
+        n = len(games.teams)
+        s = date_slice(games.dates, date_from, date_to)
+        known = ~(np.isnan(games.win_runs[s]) | np.isnan(games.lose_runs[s]))
+        win, lose = games.win[s][known], games.lose[s][known]
+        wr, lr = games.win_runs[s][known], games.lose_runs[s][known]
+
+        runs_for = np.bincount(win, weights=wr, minlength=n) + np.bincount(lose, weights=lr, minlength=n)
+        runs_against = np.bincount(win, weights=lr, minlength=n) + np.bincount(lose, weights=wr, minlength=n)
+        rf, ra = runs_for ** PYTHAG_EXPONENT, runs_against ** PYTHAG_EXPONENT
+        pythag = np.divide(rf, rf + ra, out=np.zeros(n), where=(rf + ra) > 0)
+
+        return {
+            t: {
+                'runs_for': int(runs_for[k]),
+                'runs_against': int(runs_against[k]),
+                'run_diff': int(runs_for[k] - runs_against[k]),
+                'pythag': round(float(pythag[k]), 3)
+            }
+            for k, t in enumerate(games.teams)
+        }
+
+    key = (_versions(), str(date_from or ''), str(date_to or ''))
+    return _runs_cache.get_or_set(key, build)
@@ -12,6 +12,12 @@ from backstage.views.analysis import *
 from backstage.views.manager import *
 from link import *
 from werkzeug.utils import secure_filename
+from api.metrics import init_app as init_db_metrics
+from api.bulk import import_csv_command
+from api.migrate import migrate_command
+from api.search import search_bench_command
+from api.export import export_command
+from api.fragment_cache import init_app as init_fragment_cache
 
 ## Flask-Login : 確保未登入者不能使用系統
 app = Flask(__name__)
@@ -23,6 +29,12 @@ app.register_blueprint(analysis, url_prefix='/backstage')
 app.register_blueprint(manager, url_prefix='/backstage')
 
 login_manager.init_app(app)
+init_db_metrics(app)
+app.cli.add_command(import_csv_command)
+app.cli.add_command(migrate_command)
+app.cli.add_command(search_bench_command)
+app.cli.add_command(export_command)
+init_fragment_cache(app)
 
 @app.route('/')
 def index():
@@ -1,59 +1,139 @@
-from flask import render_template, Blueprint
+import os
+from datetime import date
+from flask import render_template, Blueprint, jsonify, redirect, url_for, flash, request, Response, stream_with_context, abort
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from link import *
-from api.sql import Analysis
+from api.sql import Analysis, DB, SalesRollup
+from api.cache import TTLCache
+from api.metrics import query_stats
+from api.export import EXPORTS, FORMATS, generate
 
 analysis = Blueprint('analysis', __name__, template_folder='../templates')
 
-@analysis.route('/dashboard')
-@login_required
-def dashboard():
-    revenue = []
-    dataa = []
-    for i in range(1,13):
-        row = Analysis.month_price(i)
-
-        if not row:
-            revenue.append(0)
-        else:
-            for j in row:
-                revenue.append(j[1])
-        
-        row = Analysis.month_count(i)
-        
-        if not row:
-            dataa.append(0)
-        else:
-            for k in row:
-                dataa.append(k[1])
-        
-    row = Analysis.category_sale()
+# 儀表板的會員消費排行只顯示前 N 名
+DASHBOARD_TOP_MEMBERS = int(os.getenv('DASHBOARD_TOP_MEMBERS', 10))
+
+# 儀表板資料快取，鍵為 (MAX(oid), 年份)，有新訂單時才重新計算
+_dashboard_cache = TTLCache(maxsize=16)
+
+
+def build_dashboard(year):
+    # 各月營收與訂單數取自 sales_rollup，只算指定年份
+    revenue = [0] * 12
+    dataa = [0] * 12
+    for bucket, price, count in SalesRollup.get_range('month', date(year, 1, 1), date(year, 12, 31)):
+        revenue[bucket.month - 1] = price
+        dataa[bucket.month - 1] = count
+
     datab = []
-    for i in row:
-        temp = {
+    for i in Analysis.category_sale():
+        datab.append({
             'value': i[0],
             'name': i[1]
-        }
-        datab.append(temp)
-    
-    row = Analysis.member_sale()
-    
-    datac = []
-    nameList = []
-    counter = 0
-    
-    for i in row:
-        counter = counter + 1
-        datac.append(i[0])
-    for j in row:
-        nameList.append(j[2])
-    
-    counter = counter - 1
-    
-    row = Analysis.member_sale_count()
-    countList = []
-    
-    for i in row:
-        countList.append(i[0])
-        
-    return render_template('dashboard.html', counter = counter, revenue = revenue, dataa = dataa, datab = datab, datac = datac, nameList = nameList, countList = countList, user=current_user.name)
\ No newline at end of file
+        })
+
+    ranking = Analysis.member_ranking(DASHBOARD_TOP_MEMBERS)
+    datac = [r[0] for r in ranking]
+    countList = [r[1] for r in ranking]
+    nameList = [r[3] for r in ranking]
+
+    return {
+        'year': year,
+        'counter': len(datac) - 1,
+        'revenue': revenue,
+        'dataa': dataa,
+        'datab': datab,
+        'datac': datac,
+        'nameList': nameList,
+        'countList': countList
+    }
+
+
+def get_dashboard(year):
+    key = (Analysis.latest_order(), year)
+    return _dashboard_cache.get_or_set(key, lambda: build_dashboard(year))
+
+
+@analysis.route('/dashboard')
+@login_required
+def dashboard():
+    year = request.args.get('year', date.today().year, type=int)
+    # date() 只接受 1–9999 年，超出範圍的 ?year= 夾回可用的值而不是 500
+    year = min(max(year, date.min.year), date.max.year)
+    return render_template('dashboard.html', user=current_user.name, **get_dashboard(year))
+
+
+@analysis.route('/sales')
+@login_required
+def sales():
+    """
+    任意區間的銷售彙總: /sales?grain=day|week|month&from=YYYY-MM-DD&to=YYYY-MM-DD
+    """
+    if current_user.role != 'manager':
+        flash('No permission')
+        return redirect(url_for('index'))
+
+    grain = request.args.get('grain', 'month')
+    if grain not in SalesRollup.GRAINS:
+        abort(400)
+    # 日期格式錯誤時回 400，不交給資料庫轉型
+    try:
+        date_from, date_to = (
+            date.fromisoformat(request.args[k]) if request.args.get(k) else None
+            for k in ('from', 'to')
+        )
+    except ValueError:
+        abort(400)
+    rows = SalesRollup.get_range(grain, date_from, date_to)
+    return jsonify([
+        {'bucket': bucket.isoformat(), 'revenue': revenue, 'orders': orders}
+        for bucket, revenue, orders in rows
+    ])
+
+
+@analysis.route('/pool')
+@login_required
+def pool():
+    if current_user.role != 'manager':
+        flash('No permission')
+        return redirect(url_for('index'))
+    return jsonify(DB.pool_stats())
+
+
+@analysis.route('/metrics', methods=['GET', 'POST'])
+@login_required
+def metrics():
+    if current_user.role != 'manager':
+        flash('No permission')
+        return redirect(url_for('index'))
+
+    if request.method == 'POST' and 'reset' in request.form:
+        query_stats.reset()
+        flash('統計已重設')
+        return redirect(url_for('analysis.metrics'))
+
+    data = {
+        'statements': query_stats.top_statements(request.args.get('top', 20, type=int)),
+        'endpoints': query_stats.endpoint_summary(),
+        'pool': DB.pool_stats()
+    }
+    if request.args.get('format') == 'json':
+        return jsonify(data)
+    return render_template('metrics.html', user=current_user.name, **data)
+
+
+@analysis.route('/export/<name>.<fmt>')
+@login_required
+def export(name, fmt):
+    if current_user.role != 'manager':
+        flash('No permission')
+        return redirect(url_for('index'))
+    if name not in EXPORTS or fmt not in FORMATS:
+        abort(404)
+
+    # 邊查邊送，回應以 chunked 方式傳輸
+    return Response(
+        stream_with_context(generate(name, fmt)),
+        mimetype=FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename={name}.{fmt}'}
+    )
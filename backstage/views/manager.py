@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, request, url_for, redirect, flash
 from flask_login import login_required, current_user
-from api.sql import Team, Player, Coach, Game, Field
+from api.sql import Team, Player, Coach, Game, Field, FormOptions, Order_List
+from api.bulk import IMPORT_TABLES, BulkImportError, import_upload
 
 manager = Blueprint('manager', __name__, template_folder='../templates')
 
@@ -24,8 +25,8 @@ def teamManager():
         return redirect(url_for('index'))
 
     # 取得所有球場名稱（給下拉選單用）
-    fields = Field.get_all_fields()
-    field_list = [r[1] for r in fields]  # 只取 fName
+    options = FormOptions.load()
+    field_list = [f['fname'] for f in options['fields']]  # 只取 fName
 
     if request.method == 'POST' and 'add' in request.form:
         # 若總教練未填，設為 None
@@ -76,13 +77,10 @@ def teamManager():
 def editTeam():
     tName = request.args.get('tName')
 
-    # 取得球場清單
-    fields = Field.get_all_fields()
-    field_list = [r[1] for r in fields]  # 只取 fName
-
-    # 取得教練清單（提供 cNo + cName 給下拉式選單使用）
-    coaches = Coach.get_all_coaches()
-    coach_list = [{'cNo': r[0], 'cName': r[1]} for r in coaches]
+    # 球場與教練清單一次取得（提供 cNo + cName 給下拉式選單使用）
+    options = FormOptions.load()
+    field_list = [f['fname'] for f in options['fields']]  # 只取 fName
+    coach_list = [{'cNo': c['cno'], 'cName': c['cname']} for c in options['coaches']]
 
     if request.method == 'POST':
         Team.update_team({
@@ -173,7 +171,7 @@ def playerManager():
     ]
 
     # 給新增表單的隊伍清單（下拉選單用）
-    teams = [{'tName': t[0]} for t in Team.get_all_teams()]
+    teams = [{'tName': t} for t in FormOptions.load()['teams']]
     return render_template('playerManager.html', player_data=data, team_list=teams, user=current_user.name)
 
 
@@ -216,7 +214,7 @@ def editPlayer():
         data = {}
 
     # 下拉選單顯示全部隊伍
-    teams = [{'tName': t[0]} for t in Team.get_all_teams()]
+    teams = [{'tName': t} for t in FormOptions.load()['teams']]
     return render_template('editPlayer.html', data=data, team_list=teams, user=current_user.name)
 
 
@@ -233,7 +231,7 @@ def coachManager():
         return redirect(url_for('index'))
 
     # ✅ 取得隊伍清單供下拉選單使用
-    team_list = [{'tName': r[0]} for r in Team.get_all_teams()]
+    team_list = [{'tName': t} for t in FormOptions.load()['teams']]
 
     # 新增教練
     if request.method == 'POST' and 'add' in request.form:
@@ -268,7 +266,7 @@ def editCoach():
     cNo = request.args.get('cNo')
 
     # ✅ 下拉選單的隊伍清單
-    team_list = [{'tName': r[0]} for r in Team.get_all_teams()]
+    team_list = [{'tName': t} for t in FormOptions.load()['teams']]
 
     if request.method == 'POST':
         Coach.update_coach({
@@ -288,6 +286,9 @@ def editCoach():
 
 
 # ========== 賽局管理 ==========
+GAME_PAGE_SIZE = 50
+
+
 @manager.route('/gameManager', methods=['GET', 'POST'])
 @login_required
 def gameManager():
@@ -295,13 +296,10 @@ def gameManager():
         flash('No permission')
         return redirect(url_for('index'))
 
-    # ✅ 抓所有隊伍名稱與球場名稱
-    team_list = [{'tName': r[0]} for r in Team.get_all_teams()]
-    field_list = [{'fName': r[1]} for r in Field.get_all_fields()]  # 加這行
-
-    # ✅ 抓所有日期（已登錄比賽日期）
-    date_rows = Game.get_all_games()
-    date_list = sorted(list({str(r[2]) for r in date_rows}))  # 去重+排序
+    # ✅ 隊伍與球場一次取得
+    options = FormOptions.load()
+    team_list = [{'tName': t} for t in options['teams']]
+    field_list = [{'fName': f['fname']} for f in options['fields']]
 
     if request.method == 'POST' and 'add' in request.form:
         Game.add_game({
@@ -331,15 +329,28 @@ def gameManager():
                                     loseTeam=parts[1],
                                     date=parts[2]))
 
-    rows = Game.get_all_games()
+    # 篩選條件與分頁游標（after = 上一頁最後一筆的 日期|勝隊|敗隊）
+    filters = {
+        'team': request.args.get('team') or None,
+        'field': request.args.get('field') or None,
+        'date_from': request.args.get('date_from') or None,
+        'date_to': request.args.get('date_to') or None
+    }
+    after = request.args.get('after', '').split('|')
+    after = (after[0], after[1], after[2]) if len(after) == 3 else None
+
+    rows, next_after = Game.page(after=after, size=GAME_PAGE_SIZE, **filters)
     data = [{'winTeam': r[0], 'loseTeam': r[1], 'date': r[2], 'fName': r[3]} for r in rows]
+    next_cursor = '|'.join(str(v) for v in next_after) if next_after else None
 
     return render_template(
         'gameManager.html',
         game_data=data,
         team_list=team_list,
         field_list=field_list,  # 傳進 template
-        date_list=date_list,
+        filters=filters,
+        is_first_page=after is None,
+        next_cursor=next_cursor,
         user=current_user.name
     )
 
@@ -352,10 +363,9 @@ def editGame():
     oldDate = request.args.get('date')
 
     # ✅ 下拉式選單資料
-    team_list = [{'tName': r[0]} for r in Team.get_all_teams()]
-    field_list = [{'fName': r[1]} for r in Field.get_all_fields()]  # 新增這行
-    date_rows = Game.get_all_games()
-    date_list = sorted(list({str(r[2]) for r in date_rows}))
+    options = FormOptions.load()
+    team_list = [{'tName': t} for t in options['teams']]
+    field_list = [{'fName': f['fname']} for f in options['fields']]
 
     if request.method == 'POST':
         Game.update_game({
@@ -389,7 +399,6 @@ def editGame():
         data=game_info,
         team_list=team_list,
         field_list=field_list,  # 傳給模板
-        date_list=date_list,
         user=current_user.name
     )
 
@@ -447,5 +456,74 @@ def editField():
     return render_template('editField.html', data=data, user=current_user.name)
 
 
+# ========== 訂單管理 ==========
+ORDER_PAGE_SIZE = 20
+
+
+@manager.route('/orderManager', methods=['GET'])
+@login_required
+def orderManager():
+    if current_user.role != 'manager':
+        flash('No permission')
+        return redirect(url_for('index'))
+
+    # after = 上一頁最後一筆的 訂單時間|訂單編號
+    after = request.args.get('after', '').split('|')
+    after = (after[0], after[1]) if len(after) == 2 else None
+
+    rows, next_after = Order_List.page(after=after, size=ORDER_PAGE_SIZE)
+    orderData = [
+        {
+            '訂單編號': r[0],
+            '訂購人': r[1],
+            '訂單總價': r[2],
+            '訂單時間': r[3]
+        } for r in rows
+    ]
+
+    # 明細只查這一頁的訂單
+    details = Order_List.get_details([r[0] for r in rows])
+    orderDetail = [
+        {
+            '訂單編號': d[0],
+            '商品名稱': d[1],
+            '商品單價': d[2],
+            '訂購數量': d[3]
+        } for d in details
+    ]
+    next_cursor = f"{next_after[0]}|{next_after[1]}" if next_after else None
+
+    return render_template(
+        'orderManager.html',
+        orderData=orderData,
+        orderDetail=orderDetail,
+        is_first_page=after is None,
+        next_cursor=next_cursor,
+        user=current_user.name
+    )
+
 
+# ========== 批次匯入 (CSV) ==========
+@manager.route('/importData', methods=['GET', 'POST'])
+@login_required
+def importData():
+    if current_user.role != 'manager':
+        flash('No permission')
+        return redirect(url_for('index'))
 
+    if request.method == 'POST':
+        table = request.form.get('table')
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('請選擇要匯入的 CSV 檔')
+            return redirect(url_for('manager.importData'))
+        try:
+            result = import_upload(table, upload)
+        except BulkImportError as e:
+            flash(f'匯入失敗：{e}')
+            return redirect(url_for('manager.importData'))
+        flash(f"匯入完成：讀入 {result['staged']} 筆，新增 {result['inserted']} 筆，略過 {result['skipped']} 筆")
+        return redirect(url_for('manager.importData'))
+
+    tables = [{'name': name, 'columns': spec['columns']} for name, spec in IMPORT_TABLES.items()]
+    return render_template('importData.html', tables=tables, user=current_user.name)
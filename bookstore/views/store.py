@@ -14,60 +14,26 @@ from link import *
 import math
 from base64 import b64encode
 # 導入 DB class
-from api.sql import Member, Order_List, Product, Record, Cart, Player, Team, Game,TeamRecord, Coach
+from api.conditional import conditional_get
+from api import standings
+from api.sql import Member, Order_List, Product, Record, Cart, Player, Team, Game, TeamRecord, TeamStanding, Coach, TableVersion
 
 store = Blueprint('bookstore', __name__, template_folder='../templates')
 
+PAGE_SIZE = 9
+# 分頁列只顯示目前頁前後各幾頁，不隨商品總數增加
+PAGER_WINDOW = 2
+
+
 @store.route('/', methods=['GET', 'POST'])
 @login_required
 def bookstore():
-    # --- 這是你原有的 bookstore() 函式，我們保留它 ---
-    result = Product.count()
-    count = math.ceil(result[0]/9)
-    flag = 0
-
     if request.method == 'GET':
         if(current_user.role == 'manager'):
             flash('No permission')
             return redirect(url_for('manager.home'))
 
-    if 'keyword' in request.args and 'page' in request.args:
-        total = 0
-        single = 1
-        page = int(request.args['page'])
-        start = (page - 1) * 9
-        end = page * 9
-        search = request.values.get('keyword')
-        keyword = search
-
-        sql = "SELECT pid, pname, price FROM product WHERE pname ILIKE %s"
-        book_row = DB.fetchall(sql, ('%' + search + '%',))
-
-        book_data = []
-        final_data = []
-
-        for i in book_row:
-            book = {
-                '商品編號': i[0],
-                '商品名稱': i[1],
-                '商品價格': i[2]
-            }
-            book_data.append(book)
-            total = total + 1
-
-        if(len(book_data) < end):
-            end = len(book_data)
-            flag = 1
-
-        for j in range(start, end):
-            final_data.append(book_data[j])
-
-        count = math.ceil(total/9)
-
-        return render_template('bookstore.html', single=single, keyword=search, book_data=book_data, user=current_user.name, page=1, flag=flag, count=count)
-
-
-    elif 'pid' in request.args:
+    if 'pid' in request.args:
         pid = request.args['pid']
         data = Product.get_product(pid)
 
@@ -88,74 +54,33 @@ def bookstore():
 
         return render_template('product.html', data = product, user=current_user.name)
 
-    elif 'page' in request.args:
-        page = int(request.args['page'])
-        start = (page - 1) * 9
-        end = page * 9
-
-        book_row = Product.get_all_product()
-        book_data = []
-        final_data = []
-
-        for i in book_row:
-            book = {
-                '商品編號': i[0],
-                '商品名稱': i[1],
-                '商品價格': i[2]
-            }
-            book_data.append(book)
-
-        if(len(book_data) < end):
-            end = len(book_data)
-            flag = 1
-
-        for j in range(start, end):
-            final_data.append(book_data[j])
-
-        return render_template('bookstore.html', book_data=final_data, user=current_user.name, page=page, flag=flag, count=count)
-
-    elif 'keyword' in request.args:
-        single = 1
-        search = request.values.get('keyword')
-        keyword = search
-
-        sql = "SELECT pid, pname, price FROM product WHERE pname ILIKE %s"
-        book_row = DB.fetchall(sql, ('%' + search + '%',))
-
-        book_data = []
-        total = 0
-
-        for i in book_row:
-            book = {
-                '商品編號': i[0],
-                '商品名稱': i[1],
-                '商品價格': i[2]
-            }
-
-            book_data.append(book)
-            total = total + 1
-
-        if(len(book_data) < 9):
-            flag = 1
-
-        count = math.ceil(total/9)
-
-        return render_template('bookstore.html', keyword=search, single=single, book_data=book_data, user=current_user.name, page=1, flag=flag, count=count)
+    # 分頁交給資料庫：有 after 時用 keyset 取下一頁，否則依頁碼 offset
+    keyword = request.values.get('keyword') or None
+    single = 1 if keyword else 0
+    page = max(request.args.get('page', 1, type=int), 1)
+    after = request.args.get('after') or None
+
+    book_row, has_more = Product.page(after, PAGE_SIZE, keyword, offset=(page - 1) * PAGE_SIZE)
+    flag = 0 if has_more else 1
+
+    # 頁碼只列目前頁附近；關鍵字搜尋不算總筆數，只看有沒有下一頁
+    last = page + 1 if has_more else page
+    if not keyword:
+        last = max(min(math.ceil(Product.estimate_count() / PAGE_SIZE), page + PAGER_WINDOW), last)
+    pages = range(max(1, page - PAGER_WINDOW), last + 1)
+
+    book_data = []
+    for i in book_row:
+        book = {
+            '商品編號': i[0],
+            '商品名稱': i[1],
+            '商品價格': i[2]
+        }
+        book_data.append(book)
 
-    else:
-        book_row = Product.get_all_product()
-        book_data = []
-        temp = 0
-        for i in book_row:
-            book = {
-                '商品編號': i[0],
-                '商品名稱': i[1],
-                '商品價格': i[2],
-            }
-            if len(book_data) < 9:
-                book_data.append(book)
+    next_after = book_row[-1][0] if book_row else None
 
-        return render_template('bookstore.html', book_data=book_data, user=current_user.name, page=1, flag=flag, count=count)
+    return render_template('bookstore.html', single=single, keyword=keyword, book_data=book_data, user=current_user.name, page=page, flag=flag, pages=pages, next_after=next_after)
 
 
 @store.route('/cart', methods=['GET', 'POST'])
@@ -164,6 +89,9 @@ def cart():
     # 當有人 POST (例如嘗試加入購物車) 到這個頁面時，
     # 我們把他導向主頁，因為這個頁面現在只顯示戰績。
     if request.method == 'POST':
+        # 商品列表的「加入購物車」按鈕送出 pid：一個交易內完成取得購物車與累加數量
+        if 'pid' in request.form:
+            Cart.add_item(current_user.id, request.form['pid'], datetime.now().strftime('%Y/%m/%d %H:%M:%S'))
         flash('Action completed, returning to store.')
         return redirect(url_for('bookstore.bookstore'))
 
@@ -181,21 +109,24 @@ def cart():
 
 @store.route('/playerlist', methods=['GET'])
 @login_required
+@conditional_get('team', 'player')
 def playerlist():
     if current_user.role == 'manager':
         flash('No permission')
         return redirect(url_for('manager.home'))
 
     keyword = request.args.get('keyword', '').strip()
+    # 片段快取的鍵：在查詢之前讀版本號，查詢期間有寫入時不會把舊資料存到新版本下
+    versions = TableVersion.get('team', 'player')
 
-    # 先取得所有隊伍
+    # 先取得所有隊伍，再一次撈出這些隊伍的球員
     teams_data = Team.get_all_teams()
+    roster = Player.get_players_for_teams([t[0] for t in teams_data], keyword)
     teams = []
 
     for team_row in teams_data:
         tName = team_row[0]
-        # 依據關鍵字取該隊球員
-        players = Player.get_players_by_team(tName, keyword)
+        players = roster.get(tName, [])
 
         team = {
             'name': tName,
@@ -220,7 +151,7 @@ def playerlist():
 
             teams.append(team)
 
-    return render_template('playerlist.html', teams=teams, keyword=keyword, user=current_user.name)
+    return render_template('playerlist.html', teams=teams, keyword=keyword, versions=versions, user=current_user.name)
 
 
 @store.route('/playerinfo')
@@ -254,6 +185,7 @@ def playerinfo():
 
 @store.route('/gamelist', methods=['GET'])
 @login_required
+@conditional_get('game')
 def gamelist():
     if current_user.role == 'manager':
         flash('No permission')
@@ -262,6 +194,8 @@ def gamelist():
     team = request.args.get('team', '').strip()
     field = request.args.get('field', '').strip()
     date = request.args.get('date', '').strip()
+    # 片段快取的鍵：在查詢之前讀版本號
+    versions = TableVersion.get('game')
 
     # 檢查是否有篩選
     if team or field or date:
@@ -278,7 +212,7 @@ def gamelist():
             'fName': g[3],
         })
 
-    return render_template('gamelist.html', games=games, user=current_user.name)
+    return render_template('gamelist.html', games=games, versions=versions, user=current_user.name)
 
 
 @store.route('/gameinfo')
@@ -304,6 +238,10 @@ def gameinfo():
         'date': game[2],
         'fName': game[3],
         'result': game[4],
+        'winRuns': game[5],
+        'loseRuns': game[6],
+        'winLine': game[7],
+        'loseLine': game[8],
     }
 
     return render_template('gameinfo.html', game=game_info, user=current_user.name)
@@ -312,6 +250,7 @@ def gameinfo():
 # 球隊列表
 @store.route('/teamlist', methods=['GET'])
 @login_required
+@conditional_get('team', 'coach')
 def teamlist():
     if current_user.role == 'manager':
         flash('No permission')
@@ -319,15 +258,15 @@ def teamlist():
 
     keyword = request.args.get('keyword', '').strip()
 
-    # 取得所有球隊
-    teams_data = Team.get_all_teams()  # 呼叫 sql.py 的 Team.get_all_teams()
-    print(teams_data)
+    # 有關鍵字時交給資料庫以索引搜尋隊名，否則取得所有球隊
+    if keyword:
+        teams_data = Team.search_teams(tName=keyword)
+    else:
+        teams_data = Team.get_all_teams()  # 呼叫 sql.py 的 Team.get_all_teams()
     teams = []
 
     for t in teams_data:
         tName, chiefCoach, companyName, cPhone, cAddress, fName = t
-        if keyword and keyword.lower() not in tName.lower():
-            continue  # 篩選關鍵字
         teams.append({
             'tName': tName,
             'chiefCoach': chiefCoach,
@@ -343,6 +282,7 @@ def teamlist():
 # 單一球隊詳細資訊
 @store.route('/team_detail')
 @login_required
+@conditional_get('team', 'coach')
 def team_detail():
     team_name = request.args.get("team_name")
     if not team_name:
@@ -384,6 +324,7 @@ def team_detail():
 #--------------------------------------------
 @store.route('/race', methods=['GET', 'POST'])
 @login_required
+@conditional_get('team', 'game')
 def race():
     if request.method == 'POST':
         flash('Action completed, returning to store.')
@@ -393,7 +334,27 @@ def race():
         flash('No permission')
         return redirect(url_for('manager.home'))
 
-    race_data = TeamRecord.get_team_records()
+    # ?date= 時查當天的歷史戰績；勝率相同時以對戰成績決定名次
+    date = request.args.get('date', '').strip() or None
+    # 片段快取的鍵：在查詢之前讀版本號
+    versions = TableVersion.get('team', 'game')
+    # 指定日期時戰績、對戰、得失分都只算該季開季到當天
+    try:
+        if date:
+            season = standings.season_of(date)
+            season_start = standings.season_range(season)[0]
+            race_data = standings.tiebreak(standings.standings_on(date), season_start, date)
+            runs = standings.run_stats(season_start, date)
+        else:
+            # 沒有指定日期時表格為歷年累計 (頁面標題標明)，走勢圖為最近一季
+            season = standings.latest_season()
+            race_data = standings.tiebreak(TeamStanding.get_standings())
+            runs = standings.run_stats()
+    except ValueError:
+        flash('日期格式錯誤')
+        return redirect(url_for('bookstore.race'))
+    days, win_rates, games_behind = standings.trend(season)
+    no_runs = {'runs_for': 0, 'runs_against': 0, 'run_diff': 0, 'pythag': 0.0}
     races = []
     print(race_data)
 
@@ -403,8 +364,57 @@ def race():
             'wins': r[1] ,
             'losses': r[2],
             'win_rate': float(r[3]) if r[3] is not None else 0.0,
-            'games_behind': float(r[4]) if r[4] is not None else 0.0
+            'games_behind': float(r[4]) if r[4] is not None else 0.0,
+            **runs.get(r[0], no_runs)
         })
 
-    return render_template('race.html', teams=races,user=current_user.name)
+    return render_template(
+        'race.html',
+        teams=races,
+        date=date or '',
+        season=season,
+        versions=versions,
+        days=days,
+        win_rates=win_rates,
+        games_behind=games_behind,
+        user=current_user.name
+    )
+
 
+@store.route('/headtohead', methods=['GET'])
+@login_required
+@conditional_get('team', 'game')
+def headtohead():
+    if current_user.role == 'manager':
+        flash('No permission')
+        return redirect(url_for('manager.home'))
+
+    date_from = request.args.get('date_from', '').strip() or None
+    date_to = request.args.get('date_to', '').strip() or None
+    # 片段快取的鍵：在查詢之前讀版本號
+    versions = TableVersion.get('team', 'game')
+    try:
+        teams, m = standings.win_matrix(date_from, date_to)
+    except ValueError:
+        flash('日期格式錯誤')
+        return redirect(url_for('bookstore.headtohead'))
+
+    # rows[i][j] = (teams[i] 勝 teams[j], teams[j] 勝 teams[i])
+    rows = []
+    for i, team in enumerate(teams):
+        rows.append({
+            'team': team,
+            'records': [(int(m[i, j]), int(m[j, i])) for j in range(len(teams))],
+            'wins': int(m[i].sum()),
+            'losses': int(m[:, i].sum())
+        })
+
+    return render_template(
+        'headtohead.html',
+        teams=teams,
+        rows=rows,
+        date_from=date_from or '',
+        date_to=date_to or '',
+        versions=versions,
+        user=current_user.name
+    )
@@ -65,6 +65,54 @@ CREATE TABLE RECORD (
     TOTAL BIGINT
 );
 
+-- DDL for Table TEAM
+CREATE TABLE TEAM (
+    TNAME VARCHAR(128) PRIMARY KEY,
+    CHIEFCOACH VARCHAR(26),
+    COMPANYNAME VARCHAR(128),
+    CPHONE VARCHAR(26),
+    CADDRESS VARCHAR(256),
+    FNAME VARCHAR(128)
+);
+
+-- DDL for Table COACH
+CREATE TABLE COACH (
+    CNO VARCHAR(26) PRIMARY KEY,
+    CNAME VARCHAR(128),
+    BIRTHDAY DATE,
+    TNAME VARCHAR(128)
+);
+
+-- DDL for Table PLAYER
+CREATE TABLE PLAYER (
+    TNAME VARCHAR(128),
+    PNO VARCHAR(8),
+    NAME VARCHAR(128),
+    BIRTHDAY DATE,
+    POSITION VARCHAR(64),
+    HEIGHT INT,
+    WEIGHT INT,
+    EDUCATION VARCHAR(128),
+    PRIMARY KEY (TNAME, PNO)
+);
+
+-- DDL for Table FIELD
+CREATE TABLE FIELD (
+    FID VARCHAR(26) PRIMARY KEY,
+    FNAME VARCHAR(128),
+    ADDRESS VARCHAR(256)
+);
+
+-- DDL for Table GAME (比分欄位由 migrations/001_schema.sql 加上)
+CREATE TABLE GAME (
+    WINTEAM VARCHAR(128),
+    LOSETEAM VARCHAR(128),
+    DATE DATE,
+    FNAME VARCHAR(128),
+    RESULT VARCHAR(256),
+    PRIMARY KEY (WINTEAM, LOSETEAM, DATE)
+);
+
 -- Insert data into MEMBER table
 INSERT INTO MEMBER (MID, NAME, ACCOUNT, PASSWORD, IDENTITY)
 VALUES ('1', '王大明', 'MINGWANG', 'TEST', 'user');
@@ -202,4 +250,3 @@ CREATE TRIGGER ORDER_TRG
 BEFORE INSERT ON ORDER_LIST
 FOR EACH ROW
 EXECUTE FUNCTION SET_ORDER_OID();
-
@@ -0,0 +1,9 @@
+# gunicorn 會自動讀取這個檔案
+# 連線池是 lazy 建立的；worker fork 完成後才依 DB_POOL_WARMUP 預先開好連線
+
+
+def post_fork(server, worker):
+    from api.sql import DB, POOL_WARMUP
+    if POOL_WARMUP > 0:
+        opened = DB.warm_up(POOL_WARMUP)
+        server.log.info("worker %s warmed up %s DB connections", worker.pid, opened)
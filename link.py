@@ -9,12 +9,4 @@ DBNAME = os.getenv('DB_NAME')
 HOST = os.getenv('DB_HOST')
 PORT = os.getenv('DB_PORT')
 
-connection = psycopg2.connect(
-    user=USER,
-    password=PASSWORD,
-    host=HOST,
-    port=PORT,
-    dbname=DBNAME
-)
-cursor = connection.cursor()
-
+# 連線一律透過 api.sql 的 DB (lazy、fork-safe 的連線池) 取得，這裡不在 import 時連線
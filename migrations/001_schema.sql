@@ -0,0 +1,92 @@
+-- 既有資料庫的結構升級：本系列新增的表、索引與結帳函式。
+-- 全部可重複執行 (IF NOT EXISTS / OR REPLACE)，由 flask migrate 逐句執行，新資料庫載入 ebook.sql 後同樣執行一次
+
+-- DDL for Index PRODUCT_PID_IDX (keyset 分頁 ORDER BY pid)
+CREATE INDEX IF NOT EXISTS PRODUCT_PID_IDX ON PRODUCT (PID);
+
+-- DDL for Index MEMBER_ACCOUNT_KEY (註冊時以 ON CONFLICT 判斷帳號重複)
+CREATE UNIQUE INDEX IF NOT EXISTS MEMBER_ACCOUNT_KEY ON MEMBER (ACCOUNT);
+
+-- DDL for Index CART_MID_KEY (每位會員一台購物車；加入購物車時以 ON CONFLICT 避免重複建立)
+-- 既有資料中同一會員有多台購物車時，此句會失敗；先合併重複的購物車再重新執行 flask migrate
+CREATE UNIQUE INDEX IF NOT EXISTS CART_MID_KEY ON CART (MID);
+
+-- DDL for Index RECORD_TNO_PID_KEY (加入購物車時以 ON CONFLICT 累加數量)
+-- 同一購物車有重複的 (TNO, PID) 明細時同樣需先合併
+CREATE UNIQUE INDEX IF NOT EXISTS RECORD_TNO_PID_KEY ON RECORD (TNO, PID);
+
+-- DDL for Table SALES_ROLLUP (以日 / 週 / 月彙總的營收與訂單數)
+CREATE TABLE IF NOT EXISTS SALES_ROLLUP (
+    GRAIN   VARCHAR(8) NOT NULL,
+    BUCKET  DATE NOT NULL,
+    REVENUE BIGINT NOT NULL DEFAULT 0,
+    ORDERS  BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (GRAIN, BUCKET)
+);
+
+-- DDL for Function CHECKOUT_CART (結帳：加總、新增訂單、清除購物車在同一個交易內)
+CREATE OR REPLACE FUNCTION CHECKOUT_CART(P_MID BIGINT, P_ORDERTIME TIMESTAMP)
+RETURNS BIGINT AS $$
+DECLARE
+    V_TNO   BIGINT;
+    V_TOTAL BIGINT;
+    V_OID   BIGINT;
+BEGIN
+    SELECT TNO INTO V_TNO FROM CART WHERE MID = P_MID FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+
+    SELECT SUM(TOTAL) INTO V_TOTAL FROM RECORD WHERE TNO = V_TNO;
+    IF V_TOTAL IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    DELETE FROM CART WHERE MID = P_MID AND TNO = V_TNO;
+    INSERT INTO ORDER_LIST (MID, ORDERTIME, PRICE, TNO)
+    VALUES (P_MID, P_ORDERTIME, V_TOTAL, V_TNO)
+    RETURNING OID INTO V_OID;
+
+    INSERT INTO SALES_ROLLUP (GRAIN, BUCKET, REVENUE, ORDERS)
+    SELECT G.GRAIN, DATE_TRUNC(G.GRAIN, P_ORDERTIME)::DATE, V_TOTAL, 1
+    FROM (VALUES ('day'), ('week'), ('month')) AS G (GRAIN)
+    ON CONFLICT (GRAIN, BUCKET) DO UPDATE
+    SET REVENUE = SALES_ROLLUP.REVENUE + EXCLUDED.REVENUE,
+        ORDERS  = SALES_ROLLUP.ORDERS + EXCLUDED.ORDERS;
+    RETURN V_OID;
+END;
+$$ LANGUAGE PLPGSQL;
+
+-- DDL for Index ORDER_LIST_MID_ORDERTIME_IDX / ORDER_LIST_ORDERTIME_IDX / RECORD_TNO_IDX (訂單分頁與明細)
+CREATE INDEX IF NOT EXISTS ORDER_LIST_MID_ORDERTIME_IDX ON ORDER_LIST (MID, ORDERTIME DESC, OID DESC);
+CREATE INDEX IF NOT EXISTS ORDER_LIST_ORDERTIME_IDX ON ORDER_LIST (ORDERTIME DESC, OID DESC);
+CREATE INDEX IF NOT EXISTS RECORD_TNO_IDX ON RECORD (TNO);
+
+-- DDL for Index ORDER_LIST_MID_PRICE_IDX (會員消費排行)
+CREATE INDEX IF NOT EXISTS ORDER_LIST_MID_PRICE_IDX ON ORDER_LIST (MID) INCLUDE (PRICE);
+
+-- DDL for Index ORDER_LIST_OID_IDX (儀表板快取版本號 MAX(OID))
+CREATE INDEX IF NOT EXISTS ORDER_LIST_OID_IDX ON ORDER_LIST (OID);
+
+-- DDL for Table GAME (比分欄位：寫入時由 RESULT 解析；既有資料由 flask migrate 補上)
+ALTER TABLE GAME
+    ADD COLUMN IF NOT EXISTS WINRUNS  INT,
+    ADD COLUMN IF NOT EXISTS LOSERUNS INT,
+    ADD COLUMN IF NOT EXISTS WINLINE  INT[],
+    ADD COLUMN IF NOT EXISTS LOSELINE INT[];
+
+-- DDL for Index GAME_DATE_TEAMS_IDX (賽局分頁的 keyset)
+CREATE INDEX IF NOT EXISTS GAME_DATE_TEAMS_IDX ON GAME (DATE DESC, WINTEAM DESC, LOSETEAM DESC);
+
+-- DDL for Table TEAM_STANDING (增量維護的戰績表；空表時 flask migrate 會自 GAME 重建)
+CREATE TABLE IF NOT EXISTS TEAM_STANDING (
+    TNAME  VARCHAR(128) PRIMARY KEY,
+    WINS   BIGINT NOT NULL DEFAULT 0,
+    LOSSES BIGINT NOT NULL DEFAULT 0
+);
+
+-- DDL for Table TABLE_VERSION (各資料表的版本號，ETag 與快取鍵使用)
+CREATE TABLE IF NOT EXISTS TABLE_VERSION (
+    TNAME   VARCHAR(64) PRIMARY KEY,
+    VERSION BIGINT NOT NULL DEFAULT 0
+);
@@ -0,0 +1,14 @@
+-- DDL for Extension PG_TRGM 與 trigram 索引 (球員 / 球隊 / 教練 / 賽局的 ILIKE '%關鍵字%' 搜尋)
+-- CONCURRENTLY 建索引時不擋寫入，但不能放在交易區塊內 (pgAdmin 整批執行會失敗)；由 flask migrate 以 autocommit 逐句執行。
+-- 建到一半失敗會留下 INVALID 的索引，IF NOT EXISTS 會略過它：先 DROP INDEX 再重新執行 flask migrate。
+-- trigram 至少需要 3 個字元，1–2 個字的關鍵字仍會循序掃描
+CREATE EXTENSION IF NOT EXISTS PG_TRGM;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS PLAYER_NAME_TRGM_IDX ON PLAYER USING GIN (NAME GIN_TRGM_OPS);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS PLAYER_TNAME_TRGM_IDX ON PLAYER USING GIN (TNAME GIN_TRGM_OPS);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS PLAYER_POSITION_TRGM_IDX ON PLAYER USING GIN (POSITION GIN_TRGM_OPS);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS TEAM_TNAME_TRGM_IDX ON TEAM USING GIN (TNAME GIN_TRGM_OPS);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS TEAM_COMPANYNAME_TRGM_IDX ON TEAM USING GIN (COMPANYNAME GIN_TRGM_OPS);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS COACH_CNAME_TRGM_IDX ON COACH USING GIN (CNAME GIN_TRGM_OPS);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS GAME_WINTEAM_TRGM_IDX ON GAME USING GIN (WINTEAM GIN_TRGM_OPS);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS GAME_LOSETEAM_TRGM_IDX ON GAME USING GIN (LOSETEAM GIN_TRGM_OPS);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS GAME_FNAME_TRGM_IDX ON GAME USING GIN (FNAME GIN_TRGM_OPS);
@@ -0,0 +1,73 @@
+import json
+
+from api.scores import parse_result, scores_json
+
+
+def test_empty_result():
+    assert parse_result(None) == (None, None, None, None)
+    assert parse_result('') == (None, None, None, None)
+    assert parse_result('雨延') == (None, None, None, None)
+
+
+def test_score_formats():
+    assert parse_result('5:3') == (5, 3, None, None)
+    assert parse_result('5-3') == (5, 3, None, None)
+    assert parse_result('兄弟 5 比 3 樂天') == (5, 3, None, None)
+    assert parse_result('10-2') == (10, 2, None, None)
+
+
+def test_larger_score_is_winner():
+    assert parse_result('3:5') == (5, 3, None, None)
+
+
+def test_tie():
+    assert parse_result('4 : 4') == (4, 4, None, None)
+
+
+def test_date_is_not_a_score():
+    assert parse_result('2024-05-01') == (None, None, None, None)
+    assert parse_result('2024-05-01 5:3') == (5, 3, None, None)
+
+
+def test_fraction_is_not_a_line_score():
+    assert parse_result('1/2 場雨延') == (None, None, None, None)
+    assert parse_result('5:3 (1/2)') == (5, 3, None, None)
+
+
+def test_short_line_is_ignored():
+    assert parse_result('0,0,1/1,0,1') == (None, None, None, None)
+
+
+def test_line_score():
+    win, lose, winline, loseline = parse_result('5:3 0 1 0 2 0 0 0 2 0 / 0 0 0 1 0 0 2 0 x')
+    assert (win, lose) == (5, 3)
+    assert winline == [0, 1, 0, 2, 0, 0, 0, 2, 0]
+    assert loseline == [0, 0, 0, 1, 0, 0, 2, 0, None]
+
+
+def test_line_score_in_loser_first_order():
+    win, lose, winline, loseline = parse_result('3:5 0,0,0,1,0,0,2,0,0 / 0,1,0,2,0,0,0,2,0')
+    assert (win, lose) == (5, 3)
+    assert winline == [0, 1, 0, 2, 0, 0, 0, 2, 0]
+    assert loseline == [0, 0, 0, 1, 0, 0, 2, 0, 0]
+
+
+def test_line_score_without_total():
+    assert parse_result('1 0 0 0 1 / 0 0 0 0 0') == (2, 0, [1, 0, 0, 0, 1], [0, 0, 0, 0, 0])
+
+
+def test_line_score_must_match_total():
+    assert parse_result('7:2 1 1 1 0 0 / 0 0 0 0 0') == (7, 2, None, None)
+
+
+def test_scores_json_skips_unparsed():
+    rows = [
+        ('兄弟', '樂天', '2024-05-01', '5:3'),
+        ('統一', '味全', '2024-05-02', '雨延'),
+    ]
+    items = json.loads(scores_json(rows))
+    assert items == [{
+        'winteam': '兄弟', 'loseteam': '樂天', 'date': '2024-05-01', 'result': '5:3',
+        'winruns': 5, 'loseruns': 3, 'winline': None, 'loseline': None
+    }]
+    assert scores_json(rows[1:]) is None